@@ -0,0 +1,125 @@
+"""
+Small benchmarks used to keep an eye on the performance of the tool. Run directly: python Benchmark.py
+"""
+
+import csv
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+import Main
+
+
+def import_time(module, repeat=5):
+    """Measure the time it takes to import module in a fresh interpreter, the same way "python -X importtime" does. Returns the best cumulative time in seconds."""
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], stderr=subprocess.PIPE, universal_newlines=True)
+        for line in result.stderr.splitlines():
+            # Format: "import time: self [us] | cumulative | imported package"
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == module:
+                seconds = int(parts[1]) / 1e6
+                best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def bench_import_time():
+    for module in ["Main", "GUI"]:
+        print("import %s: %.1f ms" % (module, import_time(module) * 1000))
+
+
+def write_sample_list(path, count):
+    """Write an input list of count games. Half of them fully resolved, a quarter with only an appid and a quarter plain names."""
+    with open(path, "w", encoding="UTF-8", newline="") as file:
+        writer = csv.writer(file)
+        for i in range(count):
+            if i % 4 < 2:
+                writer.writerow(["Some Game Number %d" % i, str(i), "TRUE" if i % 3 else "FALSE"])
+            elif i % 4 == 2:
+                writer.writerow(["Another: Game, %d" % i, str(i), ""])
+            else:
+                file.write("Plain Game Name %d\n" % i)
+
+
+def throughput(func, count):
+    start = time.perf_counter()
+    func()
+    return count / (time.perf_counter() - start)
+
+
+def bench_parse(count=200000):
+    """Rows per second read from a previously generated csv file by the different readers."""
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    try:
+        write_sample_list(path, count)
+
+        def csv_reader_only():
+            with open(path, encoding="UTF-8", newline="") as file:
+                for _ in csv.reader(file):
+                    pass
+
+        def rows():
+            for _ in Main.users_row_gen(path):
+                pass
+
+        def games():
+            for _ in Main.users_game_gen(path):
+                pass
+
+        def mapped_rows():
+            with closing(Main.MappedInput(path)) as mapped:
+                for _ in mapped.rows():
+                    pass
+
+        print("csv.reader (baseline): %d rows/s" % throughput(csv_reader_only, count))
+        print("users_row_gen: %d rows/s" % throughput(rows, count))
+        print("MappedInput.rows: %d rows/s" % throughput(mapped_rows, count))
+        print("users_game_gen: %d rows/s" % throughput(games, count))
+    finally:
+        os.remove(path)
+
+
+def sample_app_names(count):
+    words = ["Assassin's", "Creed™", "The", "Legend", "of", "Dark", "Souls:", "Edition", "Brütal", "&", "Tales", "II", "Director's", "Cut", "-", "Remastered"]
+    return [" ".join(words[(i * 7 + j * 3) % len(words)] for j in range(2 + i % 5)) + " %d" % (i % 1000) for i in range(count)]
+
+
+def bench_simplify(counts=(100000, 1000000)):
+    """Names per second simplified one at a time and in bulk, with and without NumPy, and matched against the AppList index."""
+    try:
+        import numpy
+        Main.numpy_simplification_table()  # Built once per process. Not part of the measurement.
+    except ImportError:
+        numpy = None
+
+    for count in counts:
+        names = sample_app_names(count)
+        print("%d apps:" % count)
+        print("    simplified_name: %d names/s" % throughput(lambda: [Main.simplified_name(name) for name in names], count))
+        print("    simplified_names: %d names/s" % throughput(lambda: Main.simplified_names(names), count))
+        if numpy is not None:
+            print("    simplified_names (NumPy): %d names/s" % throughput(lambda: Main.simplified_names(names, use_numpy=True), count))
+        else:
+            print("    simplified_names (NumPy): NumPy is not installed")
+
+        app_list = Main.AppList()
+        keys = Main.simplified_names(names)
+        app_list.name_lookup = {key: str(i) for i, key in enumerate(keys)}
+        app_list.duplicates = set()
+        app_list.variant_lookup = {}
+        print("    AppList.match (whole batch): %d names/s" % throughput(lambda: app_list.match(names), count))
+
+
+def main():
+    bench_import_time()
+    bench_parse()
+    bench_simplify()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Runs the lookups in a process of its own, so that parsing the AppList, building its indexes and resolving the games never hold the GIL of the GUI's process.
+The GUI talks to the engine through EngineClient: it sends commands (load, start, stop, quit) and receives events in batches, a few times a second.
+"""
+
+import logging
+import queue
+import threading
+from contextlib import closing
+
+import Main as bk
+import ResourceStrings as st
+
+# Commands, sent by the GUI
+START = "start"  # (input path, output path, online). Process a list
+STOP = "stop"  # Stop the current run. The games that were not processed are written as they are
+QUIT = "quit"  # Stop everything, save the caches and exit
+
+# Events, sent by the engine
+TEXT = "text"  # Text for the log box. Everything written since the last batch, joined
+PROGRESS = "progress"  # The values of st.progress. See progress_values()
+READY = "ready"  # The AppList is loaded. A run started now doesn't wait for it
+FAILED = "failed"  # The AppList couldn't be loaded, even after LOAD_ATTEMPTS attempts. A run that was waiting for it didn't start
+DONE = "done"  # The run ended. True if it was stopped
+
+EVENT_INTERVAL = 0.1  # Seconds between batches of events. Keeps the GUI's main loop from handling an event per game
+LOAD_ATTEMPTS = 3  # Attempts to load the AppList before giving up. The next START tries again
+LOAD_BACKOFF = 2  # Seconds before the second attempt. Doubled before every attempt after it
+
+
+def progress_values(progress):
+    """The values st.progress is formatted with."""
+    eta = progress.eta()
+    return (progress.done, "/%d" % progress.total if progress.total is not None else "", progress.throughput(),
+            bk.format_duration(eta) if eta is not None else "?",
+            progress.counts[bk.Progress.CACHED], progress.counts[bk.Progress.OFFLINE], progress.counts[bk.Progress.NETWORK], progress.counts[bk.Progress.FAILED])
+
+
+class Engine:
+    """The engine process. Commands are read on the main thread of the process. Loading and runs happen on worker threads, and a sender thread batches their events."""
+
+    def __init__(self, events, config_path="./config.txt"):
+        self.events = events  # multiprocessing queue to the GUI
+        self.outbox = queue.Queue()  # Text strings and (event, value) pairs waiting for the sender thread
+        self.config = bk.load_config_file(config_path)
+        self.sleepy = bk.Delayer(*self.config.get("delay", [50, 1.5, 15]))
+        self.negative = bk.NegativeCache(ttl=self.config.get("negative_ttl"))
+        self.quota = bk.GoogleQuota(self.config["keys"], daily_limit=self.config.get("google_daily_limit", bk.GoogleQuota.DAILY_LIMIT))
+        self.aliases = bk.AliasTable()
+        self.app_list = None
+        self.loader = None
+        self.runner = None
+        self.progress = None
+        self.cancel = None  # Cancellation of the current run
+        self.closing = bk.Cancellation()  # Cancelled on QUIT. Stops the loading of the AppList too
+        self.sender = threading.Thread(target=self.send_events, daemon=True)
+        self.sender.start()
+
+    def send_events(self):
+        """Runs on the sender thread. Every EVENT_INTERVAL sends all the queued text as one TEXT event, the other events in order, and the progress of the run."""
+        sent_final = None
+        while True:
+            stop = self.closing.cancelled
+            texts = []
+            try:
+                while True:
+                    item = self.outbox.get_nowait()
+                    if isinstance(item, str):
+                        texts.append(item)
+                        continue
+                    if texts:
+                        self.events.put((TEXT, "".join(texts)))
+                        texts = []
+                    self.events.put(item)
+            except queue.Empty:
+                pass
+            if texts:
+                self.events.put((TEXT, "".join(texts)))
+            running = self.runner is not None and self.runner.is_alive()
+            if self.progress is not None and (running or self.progress is not sent_final):
+                self.events.put((PROGRESS, progress_values(self.progress)))
+                sent_final = None if running else self.progress  # One last time after the run ended, then nothing until the next run
+            if stop:
+                return
+            self.closing.event.wait(EVENT_INTERVAL)
+
+    def load(self):
+        """Runs on the loader thread."""
+        stage_text = {bk.AppList.STAGE_NET: st.applist_net,
+                      bk.AppList.STAGE_DISK: st.applist_disk,
+                      bk.AppList.STAGE_PARSE: st.applist_parse,
+                      bk.AppList.STAGE_INDEX: st.applist_index,
+                      bk.AppList.STAGE_DONE: st.applist_done}
+
+        def progress(stage):
+            logging.info("AppList loading stage: %s", stage)
+            self.outbox.put(stage_text[stage])
+
+        backoff = LOAD_BACKOFF
+        for attempt in range(1, LOAD_ATTEMPTS + 1):
+            try:
+                self.app_list = bk.AppList(self.aliases).fetch(progress=progress, cancel=self.closing)
+                self.outbox.put((READY, None))
+                return
+            except bk.Cancelled:
+                return
+            except Exception:
+                logging.exception("Loading the AppList failed. Attempt %d of %d", attempt, LOAD_ATTEMPTS)
+            if attempt < LOAD_ATTEMPTS:
+                self.outbox.put(st.loading_applist)
+                try:
+                    self.closing.sleep(backoff)
+                except bk.Cancelled:
+                    return
+                backoff *= 2
+        self.outbox.put(st.applist_failed)
+        self.outbox.put((FAILED, None))
+
+    def start_load(self):
+        """Start loading the AppList, unless it is loaded or being loaded already."""
+        if self.app_list is None and (self.loader is None or not self.loader.is_alive()):
+            self.loader = threading.Thread(target=self.load, daemon=True)
+            self.loader.start()
+
+    def run(self, path_in, path_out, online, cancel):
+        """Runs on the runner thread. Same as GUI.Main.action_start_parallel()"""
+        stopped = False
+        self.start_load()  # Loading failed before. Try again, LOAD_ATTEMPTS more times.
+        try:
+            while self.loader.is_alive():
+                self.loader.join(bk.CANCEL_POLL_TIME)
+                cancel.check()
+        except bk.Cancelled:
+            stopped = True
+        if self.app_list is None and not stopped:
+            return  # load() reported the failure. The output is left as it was.
+
+        # Written to a temporary file that replaces the target at the end, so the target may also be the input file that is read during the run.
+        exporter = bk.Exporter(bk.Exporter.CSVFile(path_out, atomic=True), buffer_size=100, buffer_time=5)
+        live = bk.Exporter(bk.Exporter.Queue(self.outbox))
+        self.progress.total = bk.count_lines(path_in)
+        rows = bk.users_row_gen(path_in)
+        if stopped:
+            for row in rows:
+                exporter.write_row(*row)
+        else:
+            bk.process_rows(rows, exporter, live, self.progress, self.sleepy, self.app_list, self.config, negative=self.negative, quota=self.quota, cancel=cancel, online=online)
+            stopped = cancel.cancelled
+        exporter.commit()
+        exporter.close()
+        live.close()
+        self.negative.save()
+        self.aliases.save()
+        self.outbox.put(st.stopped if stopped else st.done)
+        self.outbox.put((DONE, stopped))
+
+    def handle(self, command, args):
+        """Handle one command. Returns False on QUIT."""
+        if command == START:
+            if self.runner is not None and self.runner.is_alive():
+                logging.warning("A run is already in progress. Ignoring %s", args)
+                return True
+            self.cancel = bk.Cancellation()
+            self.progress = bk.Progress(None, self.sleepy)
+            self.runner = threading.Thread(target=self.run, args=tuple(args) + (self.cancel,), daemon=True)
+            self.runner.start()
+        elif command == STOP:
+            if self.cancel is not None:
+                self.cancel.cancel()
+        elif command == QUIT:
+            return False
+        return True
+
+    def close(self):
+        if self.cancel is not None:
+            self.cancel.cancel()
+        if self.runner is not None:
+            self.runner.join()  # Quick. The runner only writes out what it has.
+        self.closing.cancel()
+        self.sender.join()
+        self.events.cancel_join_thread()  # Don't wait for a GUI that stopped reading
+        self.negative.save()
+        self.aliases.save()
+
+
+def serve(commands, events, config_path="./config.txt", log_path="log_engine.txt"):
+    """The entry point of the engine process."""
+    bk.init_log(filename=log_path, level=logging.INFO, queued=True)
+    with closing(Engine(events, config_path)) as engine:
+        engine.start_load()
+        while engine.handle(*commands.get()):
+            pass
+    logging.shutdown()
+
+
+class EngineClient:
+    """The GUI's side of the engine. The GUI must call multiprocessing.freeze_support() first thing, or a frozen build starts the GUI again in the engine's process. Usage:
+        engine = EngineClient()
+        engine.start()
+        engine.send(START, input_path, output_path, online)
+        for event, value in engine.poll():  # From the GUI's main loop
+            ...
+        engine.close()
+    """
+
+    def __init__(self, config_path="./config.txt"):
+        self.config_path = config_path
+        self.commands = None
+        self.events = None
+        self.process = None
+
+    def start(self):
+        import multiprocessing  # Imported on first use. Not needed for showing the main window.
+        context = multiprocessing.get_context("spawn")  # A fresh interpreter. Forking a process that already runs Tk isn't safe
+        self.commands = context.Queue()
+        self.events = context.Queue()
+        self.process = context.Process(target=serve, args=(self.commands, self.events, self.config_path), daemon=True)
+        self.process.start()
+
+    def send(self, command, *args):
+        self.commands.put((command, args))
+
+    def poll(self):
+        """All the events that arrived so far. Never blocks."""
+        events = []
+        try:
+            while True:
+                events.append(self.events.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+    def close(self, wait=10):
+        """Ask the engine to quit and wait for it. The engine writes out the current run and saves its caches first."""
+        if self.process is None:
+            return
+        self.send(QUIT)
+        self.process.join(wait)
+        if self.process.is_alive():
+            logging.warning("The engine didn't quit in %d seconds. Terminating it.", wait)
+            self.process.terminate()
+        self.process = None
@@ -1,13 +1,18 @@
 import threading
+import queue
+import concurrent.futures
 import tkinter as tk
-import tkinter.filedialog
 import Main as bk
+import Engine
 import ResourceStrings as st
 import logging
 from contextlib import closing
 
 
 class Main:
+    LOG_POLL_MS = 100  # How often the main loop moves text from the worker threads into the text box
+    LOG_MAX_LINES = 2000  # Older log lines are removed from the text box. The full log is still written to log.txt
+
     def __init__(self):
         self.root = tk.Tk()
         self.root.title(st.program_title)
@@ -20,13 +25,17 @@ class Main:
         self.button_open = tk.Button(self.frame_buttons, text=st.button_open, command=self.action_open)
         self.button_save = tk.Button(self.frame_buttons, text=st.button_save, command=self.action_save, state=tk.DISABLED)
         self.button_start = tk.Button(self.frame_buttons, text=st.button_start, command=self.action_start, state=tk.DISABLED)
+        self.button_stop = tk.Button(self.frame_buttons, text=st.button_stop, command=self.action_stop, state=tk.DISABLED)
         self.checkbox_online_var = True
         self.checkbox_online = tk.Checkbutton(self.frame_buttons, text=st.checkbox_online, command=self.action_checkbox)
         self.checkbox_online.select()
         self.button_open.pack(side=tk.TOP, fill=tk.X)
         self.button_save.pack(side=tk.TOP, fill=tk.X)
         self.button_start.pack(side=tk.TOP, fill=tk.X)
+        self.button_stop.pack(side=tk.TOP, fill=tk.X)
         self.checkbox_online.pack(side=tk.TOP, fill=tk.X)
+        self.label_progress = tk.Label(self.frame_buttons, justify=tk.LEFT, anchor=tk.NW, wraplength=160)
+        self.label_progress.pack(side=tk.TOP, fill=tk.X)
 
 
 
@@ -36,6 +45,8 @@ class Main:
         self.text_output = tk.Text(self.frame_text, wrap=tk.WORD)
         self.text_output.pack(side=tk.LEFT, fill=tk.BOTH, expand=1)
         self.text_output.insert(tk.END, st.instruction)
+        self.text_output.mark_set("log_start", tk.END + "-1c")
+        self.text_output.mark_gravity("log_start", tk.LEFT)
 
         self.scroll_text = tk.Scrollbar(self.frame_text, orient=tk.VERTICAL, command=self.text_output.yview)
         self.scroll_text.pack(side=tk.RIGHT, fill=tk.Y)
@@ -43,39 +54,150 @@ class Main:
 
         self.config = None
         self.app_list = None
+        self.app_list_future = None
         self.sleepy = None
+        self.negative = None
+        self.quota = None
+        self.aliases = None
         self.exporter = None
+        self.engine = None  # EngineClient, when the lookups run in a process of their own. See Engine.py
         self.input_location = None
-        self.input_list = None
+        self.output_location = None
+        self.engine_progress = None  # The last progress values sent by the engine
+        self.engine_ready = False  # The engine loaded the AppList
         self.thread_obj = None
-        self.thread_stop = False
+        self.progress = None  # Progress of the current run
+        self.cancel = None  # Cancellation of the current run
+        self.closing = bk.Cancellation()  # Cancelled when the window closes. Stops the loading of the AppList too
         self.thread_lock_cond = threading.Condition()
+        self.log_queue = queue.Queue()  # Text waiting to be added to the text box. Filled by any thread, drained by the main loop.
+        self.ui_calls = queue.Queue()  # Widget changes requested by the worker threads. Tk may only be touched from the main loop.
 
     def start(self):
         """Start the main window"""
         logging.info("Loading configuration file")
-        self.text_output.insert(tk.END, st.loading_config)
+        self.post(st.loading_config)
         self.config = bk.load_config_file("./config.txt")
         if self.config["key"] is None:
-            self.text_output.insert(tk.END, st.google_not_found)
+            self.post(st.google_not_found)
             self.checkbox_online.deselect()
             self.checkbox_online_var = False
             self.checkbox_online.config(state=tk.DISABLED)
 
+        if self.config.get("engine_process", True):
+            # Loading the AppList and processing the list never compete with the main loop for the GIL. The window stays responsive.
+            logging.info("Starting the engine process")
+            self.engine = Engine.EngineClient()
+            self.engine.start()
+            self.poll()
+            self.root.mainloop()
+            return
+
         logging.info("Creating delay timer")
-        self.text_output.insert(tk.END, st.loading_delay)
+        self.post(st.loading_delay)
         self.sleepy = bk.Delayer(50, 1.5, 15)
+        self.negative = bk.NegativeCache(ttl=self.config.get("negative_ttl"))
+        self.quota = bk.GoogleQuota(self.config["keys"], daily_limit=self.config.get("google_daily_limit", bk.GoogleQuota.DAILY_LIMIT))
+        self.aliases = bk.AliasTable()
+
+        # The window is shown while the AppList is being loaded. Most of the time it is ready before the user selects his files.
+        logging.info("Loading AppList in the background")
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.app_list_future = executor.submit(self.load_applist)
+        executor.shutdown(wait=False)
+        self.poll()
         self.root.mainloop()
 
+    def post(self, text):
+        """Queue text to be added to the text box. Safe to call from any thread."""
+        self.log_queue.put(text)
+
+    def call_soon(self, func, *args):
+        """Queue a call to be made from the main loop. Used by the worker threads to change widgets."""
+        self.ui_calls.put((func, args))
+
+    def poll(self):
+        """Runs in the main loop every LOG_POLL_MS. Adds all the queued text to the text box with a single insert and runs the queued widget changes."""
+        chunks = []
+        try:
+            while True:
+                chunks.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if self.engine is not None:
+            for event, value in self.engine.poll():
+                if event == Engine.TEXT:
+                    chunks.append(value)
+                elif event == Engine.READY:
+                    self.engine_ready = True
+                elif event == Engine.PROGRESS:
+                    self.engine_progress = value
+                elif event == Engine.DONE:
+                    self.action_done()
+                elif event == Engine.FAILED and self.button_stop["state"] == tk.NORMAL:
+                    self.action_done()  # The run was waiting for the AppList. It never started
+                    self.button_start.config(state=tk.NORMAL)
+
+        if chunks:
+            chunks = chunks[-Main.LOG_MAX_LINES:]  # Whatever doesn't fit would be trimmed right away anyway
+            self.text_output.insert(tk.END, "".join(chunks))
+            self.trim_log()
+            self.text_output.see(tk.END)
+
+        try:
+            while True:
+                func, args = self.ui_calls.get_nowait()
+                func(*args)
+        except queue.Empty:
+            pass
+
+        if self.engine_progress is not None:
+            self.label_progress.config(text=st.progress % self.engine_progress)
+        elif self.progress is not None:
+            self.label_progress.config(text=st.progress % Engine.progress_values(self.progress))
+
+        self.root.after(Main.LOG_POLL_MS, self.poll)
+
+    def trim_log(self):
+        """Keep only the last LOG_MAX_LINES lines of the log. The instructions above the log are left alone."""
+        last_line = int(self.text_output.index(tk.END + "-1c").split(".")[0])
+        first_line = int(self.text_output.index("log_start").split(".")[0])
+        excess = last_line - first_line - Main.LOG_MAX_LINES
+        if excess > 0:
+            self.text_output.delete("log_start", "log_start + %d lines" % excess)
+
+    def load_applist(self):
+        """Runs on a background thread. Fetches the AppList and builds its indexes, reporting the progress in the text box."""
+        stage_text = {bk.AppList.STAGE_NET: st.applist_net,
+                      bk.AppList.STAGE_DISK: st.applist_disk,
+                      bk.AppList.STAGE_PARSE: st.applist_parse,
+                      bk.AppList.STAGE_INDEX: st.applist_index,
+                      bk.AppList.STAGE_DONE: st.applist_done}
+
+        def progress(stage):
+            logging.info("AppList loading stage: %s", stage)
+            self.post(stage_text[stage])
+
+        return bk.AppList(self.aliases).fetch(progress=progress, cancel=self.closing)
+
     def close(self):
-        with self.thread_lock_cond:
-            if self.thread_obj is not None:
-                self.thread_stop = True
+        if self.engine is not None:
+            self.engine.close()  # The engine writes out the current run and saves its caches
+        self.closing.cancel()
+        if self.cancel is not None:
+            self.cancel.cancel()
         if self.thread_obj is not None:
-            self.thread_obj.join()
+            self.thread_obj.join()  # Quick. The worker only writes out what it has.
 
-        if self.exporter is not None:
-            self.exporter.close()
+        with self.thread_lock_cond:
+            if self.exporter is not None:
+                self.exporter.close()
+
+        if self.negative is not None:
+            self.negative.save()
+        if self.aliases is not None:
+            self.aliases.save()
 
 
 
@@ -85,27 +207,34 @@ class Main:
         self.checkbox_online_var = not self.checkbox_online_var
 
     def action_open(self):
+        import tkinter.filedialog  # Imported on first use. Not needed for showing the main window.
         file_types = [(st.all_file, "*.*"), (st.csv_file, "*.csv"), (st.text_file, "*.txt")]
         selection = tk.filedialog.askopenfilename(parent=self.root, title=st.title_save, filetypes=file_types)
 
         if selection:
             logging.info("Received input location %s", selection)
-            self.input_location = selection
-            self.input_list = bk.users_game_list(selection)  # Pre-loads all the list to memory, instead of using a generator so that the file could be overwritten.
+            self.input_location = selection  # The games are read lazily when processing starts. See action_save() for how overwriting the input is handled.
             self.button_save.config(state=tk.NORMAL)
 
 
     def action_save(self):
+        import tkinter.filedialog
         file_types = [(st.csv_file, "*.csv"), (st.text_file, "*.txt"), (st.all_file, "*.*")]
         selection = tk.filedialog.asksaveasfilename(parent=self.root, title=st.title_open, defaultextension=".csv", filetypes=file_types)
 
-        if selection:
-            if self.exporter is not None:
-                self.exporter.close()
+        if selection and self.engine is not None:
+            logging.info("Output location %s", selection)
+            self.output_location = selection
+            self.button_start.config(state=tk.NORMAL)
+        elif selection:
+            with self.thread_lock_cond:
+                if self.exporter is not None:
+                    self.exporter.close()
 
             logging.info("Creating an exporter to %s", selection)
-            self.text_output.insert(tk.END, st.loading_exporter)
-            self.exporter = bk.Exporter(bk.Exporter.CSVFile(selection), bk.Exporter.TextBox(self.text_output, tk.END))
+            self.post(st.loading_exporter)
+            # Written to a temporary file that replaces the target at the end, so the target may also be the input file that is read during the run.
+            self.exporter = bk.Exporter(bk.Exporter.CSVFile(selection, atomic=True), bk.Exporter.Queue(self.log_queue))
             self.button_start.config(state=tk.NORMAL)
 
 
@@ -114,49 +243,85 @@ class Main:
         self.button_open.config(state=tk.DISABLED)
         self.button_save.config(state=tk.DISABLED)
         self.button_start.config(state=tk.DISABLED)
-        self.thread_obj = threading.Thread(target=self.action_start_parallel)
+        self.button_stop.config(state=tk.NORMAL)
+        if self.engine is not None:
+            if not self.engine_ready:
+                self.post(st.waiting_applist)  # The engine starts the run once it has the AppList, or reports that loading it failed
+            self.engine.send(Engine.START, self.input_location, self.output_location, self.checkbox_online_var)
+            return
+        self.cancel = bk.Cancellation()
+        self.progress = bk.Progress(None, self.sleepy)
+        self.thread_obj = threading.Thread(target=self.action_start_parallel, args=(self.cancel,))
         self.thread_obj.start()
 
-    def action_start_parallel(self):
-        if self.app_list is None:
-            with self.thread_lock_cond:
-                if self.thread_stop:
-                    return
-                else:
-                    logging.info("Loading AppList")
-                    self.text_output.insert(tk.END, st.loading_applist)
-            self.app_list = bk.AppList().fetch()
-
-        for game in self.input_list:
-            logging.info("Processing: %s", game.users_name)
-            accessed_net = game.find_id(self.app_list, self.config, self.checkbox_online_var)
-            if game.id is None:
-                logging.error("Couldn't find ID for %s", game.users_name)
-            else:
-                accessed_net = game.fetch_card_info() or accessed_net  # Order is important here. You don't want to short-circuit the fetch.
-                if not game.card_status_known:
-                    logging.error("Couldn't find cards status for %s", game.users_name)
-
-            with self.thread_lock_cond:
-                if self.thread_stop:
-                    break
-                else:
-                    self.exporter.write(game)
-
-
-            if accessed_net:  # We go to sleep if we gone online. Regardless of "err" and our success with fetching the cards.
-                self.sleepy.tick()
-
-        with self.thread_lock_cond:
-            if self.thread_stop:
-                return
-            else:
-                self.exporter.flush()
-                self.text_output.insert(tk.END, st.done)
+    def action_stop(self):
+        """Bound to the stop button. The worker stops within a fraction of a second, even in the middle of a sleep or a request."""
+        self.button_stop.config(state=tk.DISABLED)
+        if self.engine is not None:
+            self.engine.send(Engine.STOP)
+        if self.cancel is not None:
+            self.cancel.cancel()
 
+    def action_done(self):
+        """The run ended. The output was moved over the target. A new target must be selected before starting again."""
         self.button_open.config(state=tk.NORMAL)
         self.button_save.config(state=tk.NORMAL)
-        self.button_start.config(state=tk.NORMAL)
+        self.button_stop.config(state=tk.DISABLED)
+
+    def action_start_parallel(self, cancel):
+        stopped = False
+        try:
+            if self.app_list is None:
+                if not self.app_list_future.done():
+                    self.post(st.waiting_applist)
+                while not self.app_list_future.done():  # Usually ready by now. Loading started in self.start()
+                    cancel.sleep(bk.CANCEL_POLL_TIME)
+                try:
+                    self.app_list = self.app_list_future.result()
+                except Exception:
+                    logging.exception("Loading the AppList in the background failed. Trying again.")
+                    self.post(st.loading_applist)
+                    self.app_list = bk.AppList(self.aliases).fetch(cancel=cancel)
+        except bk.Cancelled:
+            stopped = True
+
+        self.progress.total = bk.count_lines(self.input_location)
+        rows = bk.users_row_gen(self.input_location)
+        game = None
+        try:
+            if stopped:
+                raise bk.Cancelled()
+            for row in rows:
+                cancel.check()
+                if row[2]:  # Card status is already known. Nothing to do.
+                    self.exporter.write_row(*row)
+                    self.progress.record(bk.Progress.CACHED)
+                    continue
+
+                game = bk.game_from_row(*row)
+                accessed_net = bk.resolve(game, self.app_list, self.config, self.checkbox_online_var, negative=self.negative, quota=self.quota, cancel=cancel)
+                self.exporter.write(game)
+                self.progress.record_game(game, accessed_net)
+                self.progress.log(60)
+                game = None
+
+                if accessed_net:  # We go to sleep if we gone online. Regardless of "err" and our success with fetching the cards.
+                    self.sleepy.tick(cancel)
+        except bk.Cancelled:
+            # The games that were not processed are written as they are. The target ends up with all the results found so far, and a later run can continue from there.
+            logging.info("Stopped. Writing the rest of the games as they are.")
+            stopped = True
+            if game is not None:
+                self.exporter.write(game)
+            for row in rows:
+                self.exporter.write_row(*row)
+
+        with self.thread_lock_cond:
+            self.exporter.commit()
+            self.exporter.close()
+            self.exporter = None  # The output was moved over the target. A new target must be selected before starting again.
+        self.post(st.stopped if stopped else st.done)
+        self.call_soon(self.action_done)
 
 
 
@@ -166,7 +331,7 @@ class Main:
 
 def main():
     """Starts the GUI"""
-    bk.init_log(filename="log.txt", console=True, level=logging.INFO)
+    bk.init_log(filename="log.txt", console=True, level=logging.INFO, queued=True)
 
     with closing(Main()) as window:
         window.start()
@@ -175,4 +340,6 @@ def main():
 
 
 if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # In a frozen build the engine's process starts this exe again. This runs the engine there, instead of another GUI
     main()
@@ -8,18 +8,24 @@ import csv
 import os
 import time
 import logging
+import tempfile
+import zlib
+import collections
+import threading
+from array import array
 
 import urllib
 import urllib.parse
-import urllib.request
-from contextlib import closing
-from bs4 import BeautifulSoup
+from contextlib import closing, contextmanager
 from sys import stdout as syso
 from socket import timeout
 
 
 class Game:
     """Describe a single steam app. More often than not, a game. Could also represent software, DLC, and anything bought from steam."""
+    __slots__ = ("id", "users_name", "simplified_name", "card_status_known", "has_cards")  # There is one instance per line of input. Slots keep them small.
+    GOOGLE_API_URL = "https://www.googleapis.com/customsearch/v1"
+    APP_DETAILS_URL = "http://store.steampowered.com/api/appdetails/"
 
     def __init__(self, name):
         self.id = None
@@ -34,26 +40,56 @@ class Game:
     def __repr__(self):
         return "<SteamApp: %s>" % self.users_name
 
-    def find_id(self, applist=None, config=None, online=True):
+    def find_id(self, applist=None, config=None, online=True, results=None, negative=None, quota=None, cancel=None):
+        """Find the appid of the game. Google is searched only if online. When a GoogleQuota is supplied, the key is taken from it and the search is deferred to a later run once every key used up its daily quota."""
         accessed_net = False
 
         if self.id is not None:
             logging.info("ID for %s is already known.", self.users_name)
             return accessed_net
 
+        if results is not None:
+            """Lookup the id found by a previous run. See ResultsDB"""
+            self.id = results.lookup_id(self.simplified_name)
+            if self.id is not None:
+                logging.info("ID for %s is found in the results database. %s", self.users_name, self.id)
+                return accessed_net
+
         if applist is not None:
             """Lookup your own id in the supplied list. If there are multiple games with this name it is better to leave the decision to google, if possible."""
             if not online or not applist.contains_duplicates(self.simplified_name):
-                logging.info('Looking in applist for %s' % self.users_name)
-                self.id = applist.name_lookup.get(self.simplified_name, None)  # default value = None
+                logging.info('Looking in applist for %s', self.users_name)
+                self.id = applist.lookup(self.simplified_name)  # The name itself, or another edition of the game
 
         if self.id is None and online:
             """ID wasn't found in the applist. Looking for it in google."""
-            logging.info('"%s" was not found in the applist. Looking in google.' % self.users_name)
+            logging.info('"%s" was not found in the applist. Looking in google.', self.users_name)
             # return Game.__scrap_id_from_google__(name)
-            if config["key"] is not None:
-                self.id = Game.__search_id_google_api__(self.users_name, config["cx"], config["key"])
+            reason = negative.get(NegativeCache.NAME, self.simplified_name) if negative is not None else None
+            if reason is not None:
+                logging.info("Not searching google for %s. It failed recently: %s", self.users_name, reason)
+            elif quota is not None and quota.keys:
+                fallback = applist is not None and applist.contains_duplicates(self.simplified_name)
+                credentials = quota.acquire(fallback)
+                if credentials is None:
+                    if fallback and quota.remaining() > 0:
+                        logging.info("The Google searches left today are kept for names missing from the applist. Choosing %s from the applist.", self.users_name)
+                    else:
+                        logging.warning("Google's daily quota is used up. Deferring the search for %s to a later run.", self.users_name)
+                    if applist is not None:
+                        self.id = applist.lookup(self.simplified_name)  # Better than nothing, if there are duplicates
+                else:
+                    self.id, reason = Game.__search_id_google_api__(self.users_name, credentials["cx"], credentials["key"], cancel=cancel)
+                    accessed_net = True
+                    if reason == GoogleQuota.EXHAUSTED:
+                        quota.exhaust(credentials)
+                    elif reason is not None and negative is not None:
+                        negative.add(NegativeCache.NAME, self.simplified_name, reason)
+            elif quota is None and config["key"] is not None:  # A caller that doesn't keep count of the quota
+                self.id, reason = Game.__search_id_google_api__(self.users_name, config["cx"], config["key"], cancel=cancel)
                 accessed_net = True
+                if reason is not None and reason != GoogleQuota.EXHAUSTED and negative is not None:
+                    negative.add(NegativeCache.NAME, self.simplified_name, reason)
             else:
                 logging.info("Can't search google for %s because API key is not set. Skipping.", self.users_name)
 
@@ -64,6 +100,8 @@ class Game:
     @staticmethod
     def __scrap_id_from_google__(name):
         """ Unused. Preform a google search with the name given by the user in order to locate the correct game."""
+        import urllib.request  # Imported on first use. urllib.request pulls in http.client and email, which dominate the import time of this module.
+        from bs4 import BeautifulSoup  # Optional dependency. Only needed by this unused scrapper.
         url = "http://www.google.com/search?q=site:store.steampowered.com+%s&lr=lang_en" % urllib.parse.quote(name, safe="")
         hdr = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/60.0.3112.113 Safari/537.36'}
         req = urllib.request.Request(url, headers=hdr)
@@ -93,42 +131,52 @@ class Game:
             return None
 
     @staticmethod
-    def __search_id_google_api__(name, cx, key, timeout_time=10):
-        """Uses google's custom search api to find your id"""
-        url = "https://www.googleapis.com/customsearch/v1?q=%s&cx=%s&key=%s&fields=searchInformation(totalResults),items(title,link)"
+    def __search_id_google_api__(name, cx, key, timeout_time=10, cancel=None):
+        """Uses google's custom search api to find your id. Returns the pair (app_id, reason). On failure app_id is None and reason is one of the NegativeCache reasons, or None if the failure is temporary and worth retrying."""
+        import urllib.request
+        url = Game.GOOGLE_API_URL + "?q=%s&cx=%s&key=%s&fields=searchInformation(totalResults),items(title,link)"
         url %= urllib.parse.quote(name, safe=""), urllib.parse.quote(cx, safe=""), urllib.parse.quote(key, safe="")
         hdr = {'User-Agent': 'CardsTool'}
         req = urllib.request.Request(url, headers=hdr)
         try:
-            with urllib.request.urlopen(req, timeout=timeout_time) as f:
-                json_bytes = f.read()
+            json_bytes = read_url(req, timeout_time, cancel)
         except timeout:
             logging.error("Timeout while getting appid for %s. \n\t\t%s", name, req.get_full_url())
-            return None
-        except urllib.error.HTTPError:
+            return None, None
+        except urllib.error.HTTPError as e:
+            if e.code in (403, 429):
+                logging.error("Google refused to search for %s. The daily quota of the key is probably used up. (HTTP %d)", name, e.code)
+                return None, GoogleQuota.EXHAUSTED
             logging.exception("Failed while googling the name %s", name)
-            return None
+            return None, None
         json_text = json_bytes.decode("utf-8")
         try:
             data = json.loads(json_text)
             total_results = int(data["searchInformation"]["totalResults"])
             if total_results < 1 or len(data["items"]) < 1:
                 logging.error("No results found for %s", name)
-                return None
+                return None, NegativeCache.NOT_FOUND
 
 
         except (json.decoder.JSONDecodeError, KeyError, ValueError):
             logging.exception("Failed to parse google's response for %s", name)
-            return None
+            return None, NegativeCache.PARSE_ERROR
         top_result = data["items"][0]["title"]
         top_link = data["items"][0]["link"]
 
+        if "/app/" not in top_link:
+            logging.error("The top result for %s is not a steam app: %s", name, top_link)
+            return None, NegativeCache.NOT_FOUND
         app_id = top_link[top_link.index("/app/") + len("/app/"):]
-        app_id = app_id[:app_id.index("/")]
-        return app_id
-
-    def fetch_card_info(self):
-        """Use Steam's web api to find out whatever the app has cards."""
+        app_id = app_id.split("/")[0].split("?")[0].split("#")[0]  # ".../app/123?l=en" has no slash after the id
+        if not app_id.isdecimal():
+            logging.error("The top result for %s has no appid: %s", name, top_link)
+            return None, NegativeCache.NOT_FOUND
+        return app_id, None
+
+    def fetch_card_info(self, results=None, negative=None, applist=None, cancel=None):
+        """Use Steam's web api to find out whatever the app has cards. If a ResultsDB is supplied it is checked first.
+        Apps that recently failed are skipped if a NegativeCache is supplied. The applist, if supplied, tells apart delisted apps from ones the store refuses to show in this region."""
         accessed_net = False
 
         if self.card_status_known:
@@ -137,66 +185,151 @@ class Game:
         if self.id is None:
             logging.warning("Unknown app_id: Skipping data fetch for %s.", self.users_name)
             return accessed_net
+        if results is not None:
+            has_cards = results.lookup_cards(self.id)
+            if has_cards is not None:
+                self.card_status_known = True
+                self.has_cards = has_cards
+                logging.info("Card status for %s is found in the results database. %s", self.users_name, self.has_cards)
+                return accessed_net
+        reason = negative.get(NegativeCache.APP, self.id) if negative is not None else None
+        if reason is not None:
+            logging.info("Not fetching card data for app %s (%s). It failed recently: %s", self.id, self.users_name, reason)
+            return accessed_net
         logging.info("Fetching card data for app %s (%s).", self.id, self.users_name)
-        data = Game.__app_details_steam_api__(self.id)
+        data, reason = Game.__app_details_steam_api__(self.id, cancel=cancel)
         accessed_net = True
         if data is None:
             logging.error("Fetching Failed! app %s (%s).", self.id, self.users_name)
+            if reason == NegativeCache.DELISTED and applist is not None and applist.id_lookup is not None and int(self.id) in applist.id_lookup:
+                reason = NegativeCache.REGION_LOCKED  # Still in the catalog, but the store won't show it
+            if reason is not None and negative is not None:
+                negative.add(NegativeCache.APP, self.id, reason)
             return accessed_net
 
         self.card_status_known = True
-        for tag in data["categories"]:
-            if tag["id"] == 29:  # and tag["description"] == "Steam Trading Cards":
-                self.has_cards = True
+        self.has_cards = Game.details_have_cards(data)
+        if results is not None:
+            results.store_cards([(self.id, self.has_cards, data.get("type"), None)])  # Keeps the card index of the crawler up to date
         logging.info("Card status for %s is found. %s", self.users_name, self.has_cards)
         return accessed_net
 
     @staticmethod
-    def __app_details_steam_api__(app_id, timeout_time=20):
-        """Use Steam's web api and fetch details about the app whose ID is app_id"""
-        req = urllib.request.Request("http://store.steampowered.com/api/appdetails/?appids=" + app_id)
+    def details_have_cards(data):
+        """Whatever the details returned by __app_details_steam_api__ say that the app has cards."""
+        for tag in data.get("categories", []):
+            if tag["id"] == 29:  # and tag["description"] == "Steam Trading Cards":
+                return True
+        return False
+
+    @staticmethod
+    def __app_details_steam_api__(app_id, timeout_time=20, cancel=None):
+        """Use Steam's web api and fetch details about the app whose ID is app_id. Returns the pair (data, reason), like __search_id_google_api__"""
+        import urllib.request
+        req = urllib.request.Request(Game.APP_DETAILS_URL + "?appids=" + app_id)
         try:
-            with urllib.request.urlopen(req, timeout=timeout_time) as f:
-                json_bytes = f.read()
+            json_bytes = read_url(req, timeout_time, cancel)
 
         except timeout:
             logging.error("Timeout while getting details for %s. \n\t\t%s", app_id, req.get_full_url())
-            return None
+            return None, None
         except urllib.error.HTTPError:
             logging.exception("Failed getting details for app number %s", app_id)
-            return None
+            return None, None
         json_text = json_bytes.decode("utf-8")
         try:
             game_info = json.loads(json_text)
             if not game_info[app_id]["success"]:
-                return None
+                return None, NegativeCache.DELISTED
 
             data = game_info[app_id]["data"]
-            return data
+            return data, None
 
         except (json.decoder.JSONDecodeError, KeyError):
             logging.exception("Failed to parse details for app number %s", app_id)
-            return None
+            return None, NegativeCache.PARSE_ERROR
+
+
+class GameBatch:
+    """Columnar representation of many games. Instead of a Game object per game, holds parallel arrays of names, appids and status bytes.
+    Used for very large lists, where it takes a fraction of the memory. Single games can still be taken out as Game objects and put back."""
+    NO_ID = -1
+    STATUS_UNKNOWN = 0
+    STATUS_NO_CARDS = 1
+    STATUS_HAS_CARDS = 2
+
+    def __init__(self):
+        self.names = []
+        self.appids = array("q")
+        self.status = bytearray()
+
+    def __len__(self):
+        return len(self.names)
+
+    def append_row(self, name, appid, card_status_known, has_cards):
+        self.names.append(name)
+        self.appids.append(int(appid) if appid is not None else GameBatch.NO_ID)
+        self.status.append(GameBatch.status_byte(card_status_known, has_cards))
+
+    @staticmethod
+    def status_byte(card_status_known, has_cards):
+        return GameBatch.STATUS_UNKNOWN if not card_status_known else GameBatch.STATUS_HAS_CARDS if has_cards else GameBatch.STATUS_NO_CARDS
+
+    def row(self, i):
+        """Returns the tuple (name, appid, card_status_known, has_cards) for the game at index i. The same arguments the exporters receive."""
+        appid = self.appids[i]
+        status = self.status[i]
+        return self.names[i], str(appid) if appid != GameBatch.NO_ID else None, status != GameBatch.STATUS_UNKNOWN, status == GameBatch.STATUS_HAS_CARDS
+
+    def rows(self):
+        return (self.row(i) for i in range(len(self)))
+
+    def game(self, i):
+        """Create a Game object for the game at index i."""
+        return game_from_row(*self.row(i))
+
+    def update(self, i, game):
+        """Store the results found for game, which was taken from index i, back into the batch."""
+        self.appids[i] = int(game.id) if game.id is not None else GameBatch.NO_ID
+        self.status[i] = GameBatch.status_byte(game.card_status_known, game.has_cards)
 
 
 class AppList:
     """Describe a list of appIDs and app names. Used to find the name of the app based on the id."""
     FETCH_URL = "http://api.steampowered.com/ISteamApps/GetAppList/v0001/"
-    FETCH_LOCAL_PATH = "Applist.txt"
-
-    def __init__(self):
-        self.__data__ = None
+    FETCH_TIMEOUT = 60  # Seconds without any data from the server before giving up. The whole download can take longer
+    FETCH_LOCAL_PATH = "Applist.json.gz"  # Compressed with gzip. About a tenth of the size of the raw json
+    LEGACY_LOCAL_PATH = "Applist.txt"  # Uncompressed. Written by older versions. Still read if there is no compressed file
+
+    # Stages reported by fetch() to its progress callback
+    STAGE_NET = "net"
+    STAGE_DISK = "disk"
+    STAGE_PARSE = "parse"
+    STAGE_INDEX = "index"
+    STAGE_DONE = "done"
+
+    def __init__(self, aliases=None):
+        """aliases is an optional AliasTable. Its entries are added to name_lookup when the list is loaded, and it learns the names Google resolves. See learn()"""
+        self.__data__ = None  # (appids, names) of all the apps, in the order of the AppList
         self.id_lookup = None
         self.name_lookup = None
         self.simplified_names = None
+        self.duplicates = None
+        self.variant_lookup = None  # variant_key() -> appid. Consulted when the simplified name isn't in name_lookup
+        self.variant_collisions = None  # Keys shared by different apps. Left out of variant_lookup, so they never pick the wrong one
+        self.aliases = aliases
 
     @staticmethod
-    def fetch_from_net(url=FETCH_URL):
+    def fetch_from_net(url=None, cancel=None):
         """Fetch new AppList from the web. See: http://api.steampowered.com/ISteamApps/GetAppList/v0001/ """
+        import urllib.request
+        url = url if url is not None else AppList.FETCH_URL
         req = urllib.request.Request(url)
         try:
-            with urllib.request.urlopen(req) as f:
-                json_bytes = f.read()
+            json_bytes = read_url(req, AppList.FETCH_TIMEOUT, cancel, download=True)
+        except timeout:
+            logging.error("Timeout while fetching the applist from %s", url)
+            return None
         except urllib.error.HTTPError:
             logging.exception("Failed to fetch applist from net")
             return None
@@ -204,16 +337,63 @@ class AppList:
         return json_bytes.decode("utf-8")
 
     @staticmethod
-    def fetch_from_disk(path=FETCH_LOCAL_PATH):
-        """Fetch AppList from the disk where it was previously saved."""
-        with open(path, encoding='UTF-8') as file:
-            return file.read()
+    def fetch_from_disk(path=None, chunk_size=1 << 16):
+        """Yields the apps of the AppList previously saved to the disk, one at a time, as the file is read. Gzip compressed files are decompressed chunk by chunk,
+        so neither the whole file nor its whole text is ever held in memory. Uncompressed files are read the same way. Raises ValueError if the file isn't an AppList."""
+        import io
+        import re
+        path = path if path is not None else AppList.FETCH_LOCAL_PATH
+        decoder = json.JSONDecoder()
+        with open(path, "rb") as file:
+            compressed = file.read(2) == b"\x1f\x8b"  # gzip's magic number
+            file.seek(0)
+            if compressed:
+                import gzip
+                stream = gzip.GzipFile(fileobj=file)
+            else:
+                stream = file
+            text = io.TextIOWrapper(stream, encoding="utf-8")
+            buffer = text.read(chunk_size)
+            while True:  # Skip to the list of apps: {"applist": {"apps": {"app": [
+                start = buffer.find('"app"')
+                start = buffer.find("[", start) if start >= 0 else -1
+                if start >= 0:
+                    break
+                chunk = text.read(chunk_size)
+                if not chunk:
+                    raise ValueError("%s is not an AppList" % path)
+                buffer += chunk
+            pos = start + 1
+            separator = re.compile(r"[\s,]*").match
+            while True:
+                pos = separator(buffer, pos).end()
+                if pos < len(buffer) and buffer[pos] == "]":
+                    return
+                try:
+                    app, pos = decoder.raw_decode(buffer, pos)
+                except json.decoder.JSONDecodeError:  # The app is cut by the end of the chunk. Read on
+                    chunk = text.read(chunk_size)
+                    if not chunk:
+                        raise ValueError("%s ends in the middle of the list of apps" % path)
+                    buffer = buffer[pos:] + chunk
+                    pos = 0
+                    continue
+                yield app
 
     @staticmethod
-    def write_apps_to_disk(data, path=FETCH_LOCAL_PATH):
-        """Write ApplList to the disk. Probably because a new one was fetched from the internet."""
-        with open(path, "w", encoding='UTF-8') as file:
-            file.write(data)
+    def write_apps_to_disk(data, path=None):
+        """Write ApplList to the disk. Probably because a new one was fetched from the internet. Compressed with gzip if path ends with .gz
+        Written to a temporary file that replaces path once it is complete. An interrupted write, or several runs writing at once, never leave a truncated file behind."""
+        path = path if path is not None else AppList.FETCH_LOCAL_PATH
+        if not path.endswith(".gz"):
+            write_file_atomic(path, data)
+            return
+        import gzip
+        fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+        with open(fd, "wb") as file:
+            with gzip.GzipFile(fileobj=file, mode="wb", compresslevel=6) as compressed:
+                compressed.write(data.encode("utf-8"))
+        os.replace(temp_path, path)
 
     @staticmethod
     def json_to_list(json_text):
@@ -226,39 +406,117 @@ class AppList:
             logging.exception("Failed to parse fetched applist")
             return None
 
-    def fetch(self, always_fetch_from_net=False):
-        """Fill the object with data about app names. get the data either from a local file or from the internet. Automatically access the net if the file is missing."""
+    def fetch(self, always_fetch_from_net=False, progress=None, cancel=None):
+        """Fill the object with data about app names. get the data either from a local file or from the internet. Automatically access the net if the file is missing.
+        progress is an optional callable. It is called with one of the AppList.STAGE_* constants whenever loading moves to the next stage."""
         if self.__data__ is not None:
             return self
 
-        if always_fetch_from_net or not os.path.exists(AppList.FETCH_LOCAL_PATH):
-            json_text = AppList.fetch_from_net()
-            self.__data__ = AppList.json_to_list(json_text)
+        report = progress if progress is not None else lambda stage: None
+
+        local_path = next((path for path in (AppList.FETCH_LOCAL_PATH, AppList.LEGACY_LOCAL_PATH) if os.path.exists(path)), None)
+        if always_fetch_from_net or local_path is None:
+            report(AppList.STAGE_NET)
+            json_text = AppList.fetch_from_net(cancel=cancel)
+            if json_text is None:
+                raise IOError("Failed to fetch the AppList from %s. See the log for details" % AppList.FETCH_URL)
+            report(AppList.STAGE_PARSE)
+            apps = AppList.json_to_list(json_text)
+            if apps is None:
+                raise ValueError("The AppList fetched from %s couldn't be parsed. See the log for details" % AppList.FETCH_URL)
             AppList.write_apps_to_disk(json_text)
         else:
-            self.__data__ = AppList.json_to_list(AppList.fetch_from_disk())
+            report(AppList.STAGE_DISK)
+            apps = AppList.fetch_from_disk(local_path)
+            report(AppList.STAGE_PARSE)  # The file is read, decompressed and parsed one app at a time by the loop below
 
+        app_ids, names = [], []
+        try:
+            for app in apps:
+                app_ids.append(app["appid"])
+                names.append(app["name"])
+        except (EOFError, OSError, zlib.error, ValueError, KeyError):  # gzip.BadGzipFile is an OSError
+            if isinstance(apps, list):
+                raise  # Fetched from the net already
+            logging.exception("The AppList saved in %s is damaged. Fetching it again.", local_path)
+            return self.fetch(always_fetch_from_net=True, progress=progress, cancel=cancel)
+        self.__data__ = (app_ids, names)
+        if local_path == AppList.LEGACY_LOCAL_PATH and not always_fetch_from_net:
+            logging.info("Saving a compressed copy of %s to %s", local_path, AppList.FETCH_LOCAL_PATH)
+            AppList.write_apps_to_disk(json.dumps({"applist": {"apps": {"app": [{"appid": appid, "name": name} for appid, name in zip(app_ids, names)]}}}))
+        if os.path.exists(AppList.LEGACY_LOCAL_PATH) and os.path.exists(AppList.FETCH_LOCAL_PATH):
+            logging.info("Removing %s. The compressed copy at %s replaces it", AppList.LEGACY_LOCAL_PATH, AppList.FETCH_LOCAL_PATH)
+            os.remove(AppList.LEGACY_LOCAL_PATH)  # Only once the compressed copy is complete
+
+        report(AppList.STAGE_INDEX)
         # Lookup appid->name
-        self.id_lookup = {pair["appid"]: pair["name"] for pair in self.__data__}
+        self.id_lookup = dict(zip(app_ids, names))
 
         # Lookup name->appid. It is possible that there are multiple games with the same name. Remove all of them. Handle it latter in the code.
-        self.simplified_names = [simplified_name(pair["name"]) for pair in self.__data__]
-        id_strings = [str(pair["appid"]) for pair in self.__data__]
+        self.simplified_names = simplified_names(names)
+        id_strings = [str(appid) for appid in app_ids]
 
         self.name_lookup = {name: appid for (name, appid) in zip(self.simplified_names, id_strings)}
+        self.duplicates = {name for name, count in collections.Counter(self.simplified_names).items() if count > 1}
+        self.build_variants(names, id_strings)
+        if self.aliases is not None:
+            self.name_lookup.update(self.aliases.entries)  # An alias settles which of the duplicates is meant, and overrides the AppList where they disagree
+            self.duplicates.difference_update(self.aliases.entries)
+        report(AppList.STAGE_DONE)
         return self
 
+    def build_variants(self, names, id_strings):
+        """Fill variant_lookup. The keys of whole names win over the keys of names without their subtitles, so "Portal 2" isn't lost to "Portal 2 - The Final Hours".
+        A key that different apps share at the same level goes to the app with the shortest name, if the names of all the others start with it. A game and its DLC,
+        "The Witcher 3: Wild Hunt" and "The Witcher 3: Wild Hunt - Blood and Wine", then leave "witcher 3" to the game. Otherwise the key goes to variant_collisions."""
+        self.variant_lookup = {}
+        self.variant_collisions = set()
+        titled = [(title, appid, full) for title, appid, full in ((main_title(name), appid, full) for name, appid, full in zip(names, id_strings, self.simplified_names)) if title is not None]
+        levels = [zip(map(variant_key, self.simplified_names), id_strings, self.simplified_names),
+                  zip(map(variant_key, simplified_names([title for title, appid, full in titled])), [appid for title, appid, full in titled], [full for title, appid, full in titled])]
+        for level in levels:
+            found = {}
+            collisions = {}  # key -> (appid, simplified name) of every app with this key
+            for key, appid, full in level:
+                first = found.setdefault(key, (appid, full))
+                if first[0] != appid:
+                    collisions.setdefault(key, [first]).append((appid, full))
+            for key, candidates in collisions.items():
+                shortest = min(candidates, key=lambda candidate: len(candidate[1]))
+                if all(full.startswith(shortest[1] + " ") for appid, full in candidates if appid != shortest[0]):
+                    found[key] = shortest
+                else:
+                    del found[key]
+            for key, (appid, full) in found.items():
+                self.variant_lookup.setdefault(key, appid)
+            self.variant_collisions.update(key for key in collisions if key not in found and key not in self.variant_lookup)
+        logging.info("AppList variant keys: %d, left out because different apps share them: %d", len(self.variant_lookup), len(self.variant_collisions))
+
+    def lookup(self, name):
+        """The appid of the simplified name. Falls back to its variant_key() when the name itself isn't known. None if neither is."""
+        appid = self.name_lookup.get(name)
+        if appid is None and self.variant_lookup is not None:
+            appid = self.variant_lookup.get(variant_key(name))
+        return appid
+
+    def learn(self, name, appid):
+        """Remember that the simplified name is the app appid, for the rest of this run and, through the AliasTable, for later runs too."""
+        self.name_lookup[name] = appid
+        self.duplicates.discard(name)
+        if self.aliases is not None:
+            self.aliases.add(name, appid)
+
     def contains_duplicates(self, name):
-        return self.simplified_names.count(name) > 1
+        return name in self.duplicates
 
+    def match(self, names):
+        """Look up many names at once. Returns the appid of each name, or None if it isn't in the list or has duplicates. Used for a whole batch of input."""
+        keys = simplified_names(names)
+        return [None if key in self.duplicates else self.lookup(key) for key in keys]
 
-def simplified_name(name):
-    """Takes a name and transforms it into simpler form that will be used as dict key. Used to make sure that even if the user wrote non-exact name the program will still recognize it.
-    For example transforms "Brütal Legend" into "Brutal Legend". Whatever spelling the user used in his list, both will be mapped to the same key.
-    """
-    ret = name.strip()
-    ret = ret.lower()
 
+def simplification_table():
+    """The translation table used by simplified_name()"""
     translation_table = dict.fromkeys(map(ord, "™®©!,.'’`[](){}\""), None)
     translation_table.update(dict.fromkeys(map(ord, "_-:;"), " "))
     translation_table[ord("&")] = "and"
@@ -270,15 +528,126 @@ def simplified_name(name):
     translation_table[ord("ú")] = "u"
     translation_table[ord("ü")] = "u"
     translation_table[ord("ﬁ")] = "fi"
+    return translation_table
+
 
-    ret = ret.translate(translation_table)
+SIMPLIFICATION_TABLE = simplification_table()  # Built once. Building it on every call took most of the time of simplified_name()
+
+
+def simplified_name(name):
+    """Takes a name and transforms it into simpler form that will be used as dict key. Used to make sure that even if the user wrote non-exact name the program will still recognize it.
+    For example transforms "Brütal Legend" into "Brutal Legend". Whatever spelling the user used in his list, both will be mapped to the same key.
+    """
+    ret = name.strip()
+    ret = ret.lower()
+    ret = ret.translate(SIMPLIFICATION_TABLE)
     ret = " ".join(ret.split())
     return ret
 
 
+SIMPLIFY_CHUNK = 10000  # Names simplified together by the NumPy path. Bounds the memory of the fixed width arrays.
+
+
+def simplified_names(names, use_numpy=False):
+    """Same as [simplified_name(name) for name in names], for many names at once.
+    use_numpy uses NumPy's vectorized string operations instead, if NumPy is installed. Off by default: NumPy ends up calling the same str methods for every element,
+    and measured slower than the plain loop (see Benchmark.py)."""
+    numpy = None
+    if use_numpy:
+        try:
+            import numpy
+        except ImportError:
+            logging.info("NumPy is not installed. Simplifying names without it.")
+    if numpy is None:
+        return [simplified_name(name) for name in names]  # Not inside the except clause. str.translate() is much slower while an exception is being handled.
+
+    names = list(names)
+    table = numpy_simplification_table()
+    ret = []
+    for start in range(0, len(names), SIMPLIFY_CHUNK):
+        chunk = names[start:start + SIMPLIFY_CHUNK]
+        width = 3 * max(map(len, chunk))  # Room for the names to grow. lower() and "&" -> "and" make strings longer, and NumPy's strings have a fixed width.
+        arr = numpy.array(chunk, dtype="U%d" % max(width, 1))
+        arr = numpy.char.translate(numpy.char.lower(arr), table)  # Also turns every kind of whitespace into a plain space
+
+        # Collapse runs of spaces. Only the few names that have them are touched.
+        doubled = numpy.char.find(arr, "  ") >= 0
+        while doubled.any():
+            arr[doubled] = numpy.char.replace(arr[doubled], "  ", " ")
+            doubled = numpy.char.find(arr, "  ") >= 0
+
+        ret += numpy.char.strip(arr, " ").tolist()
+    return ret
+
+
+_numpy_simplification_table = None
+
+
+def numpy_simplification_table():
+    """SIMPLIFICATION_TABLE, plus all the whitespace characters mapped to a space. Lets simplified_names() do without str.split()"""
+    global _numpy_simplification_table
+    if _numpy_simplification_table is None:
+        import sys
+        table = {c: " " for c in range(sys.maxunicode + 1) if chr(c).isspace()}
+        table.update(SIMPLIFICATION_TABLE)
+        _numpy_simplification_table = table
+    return _numpy_simplification_table
+
+
+# Trailing words that name an edition of a game rather than the game. Stripped by variant_key()
+EDITION_SUFFIXES = [["game", "of", "the", "year"], ["goty"], ["directors", "cut"], ["final", "cut"], ["edition"], ["definitive"], ["complete"], ["deluxe"],
+                    ["enhanced"], ["remastered"], ["special"], ["ultimate"], ["gold"], ["anniversary"], ["collectors"], ["standard"], ["premium"], ["digital"], ["hd"], ["redux"]]
+EDITION_SUFFIXES_BY_END = {}  # Last word -> the suffixes ending with it, the longest first
+for _suffix in sorted(EDITION_SUFFIXES, key=len, reverse=True):
+    EDITION_SUFFIXES_BY_END.setdefault(_suffix[-1], []).append(_suffix)
+del _suffix
+# "i" and "x" are left out. They are words and titles too often: "Who Am I", "Mega Man X"
+ROMAN_NUMERALS = {roman: str(i) for i, roman in enumerate(["", "", "ii", "iii", "iv", "v", "vi", "vii", "viii", "ix", "", "xi", "xii", "xiii", "xiv", "xv", "xvi", "xvii", "xviii", "xix", "xx"]) if roman}
+SUBTITLE_SEPARATORS = (":", " - ", " – ", " — ")
+
+
+def variant_key(simplified):
+    """A looser key for a simplified name, shared by the editions and spellings of the same game. Used when the simplified name itself isn't found.
+    A leading "the" and trailing edition words are removed, a roman numeral at the end becomes arabic and a trailing 1 is dropped, as the first game of a series
+    rarely has a number. "The Witcher III GOTY Edition" and "witcher 3" get the same key, and so do "Assassin's Creed: Director's Cut Edition" and "assassins creed 1"."""
+    words = simplified.split(" ")
+    if words[-1] not in EDITION_SUFFIXES_BY_END and words[-1] != "1" and words[0] != "the" and words[-1] not in ROMAN_NUMERALS:
+        return simplified  # Most names. Nothing to change
+    if len(words) > 1 and words[0] == "the":
+        del words[0]
+    while words[-1] in EDITION_SUFFIXES_BY_END:
+        suffix = next((suffix for suffix in EDITION_SUFFIXES_BY_END[words[-1]] if len(words) > len(suffix) and words[-len(suffix):] == suffix), None)
+        if suffix is None:
+            break
+        del words[-len(suffix):]
+    if len(words) > 1:  # "v" alone keeps its name
+        words[-1] = ROMAN_NUMERALS.get(words[-1], words[-1])
+    if len(words) > 1 and words[-1] == "1":
+        del words[-1]
+    return " ".join(words)
+
+
+def main_title(name):
+    """The part of name before its subtitle, or None if it has none. "Half-Life 2: Episode One" -> "Half-Life 2"."""
+    for separator in SUBTITLE_SEPARATORS:
+        index = name.find(separator)
+        if index > 0:
+            return name[:index]
+    return None
+
+
 class Exporter:
-    def __init__(self, *args):
+    def __init__(self, *args, buffer_size=1, buffer_time=None):
+        """Rows are kept in a buffer and handed to the outputs together once there are buffer_size of them or buffer_time seconds have passed since the last hand-over.
+        The default buffer_size of 1 hands every row over immediately."""
         self.exporter_list = list(args)
+        self.buffer = []
+        self.buffer_size = buffer_size
+        self.buffer_time = buffer_time
+        self.last_drain = time.monotonic()
+
+    FILE_BUFFER = 1 << 16  # Buffer size of the output files
+    FORMATS = {"csv": "CSVFile", "csv.gz": "GzipCSVFile", "jsonl": "JSONLines"}  # Output formats of run(), and the outputs that write them
 
 
     def add_output(self, exporter):
@@ -286,27 +655,93 @@ class Exporter:
 
 
     def write(self, game):
+        self.write_row(game.users_name, game.id, game.card_status_known, game.has_cards)
+
+    def write_row(self, name, appid, card_status_known, has_cards):
+        """Same as write(), for a game that is not represented by a Game object. See users_row_gen()"""
+        self.buffer.append((name, appid, card_status_known, has_cards))
+        if len(self.buffer) >= self.buffer_size or (self.buffer_time is not None and time.monotonic() - self.last_drain >= self.buffer_time):
+            self.drain()
+
+    def drain(self):
+        """Hand all the buffered rows to the outputs. Outputs that can write many rows at once get them all in one call."""
+        rows = self.buffer
+        self.buffer = []
+        self.last_drain = time.monotonic()
+        if not rows:
+            return
         for e in self.exporter_list:
-            e.write(game.users_name, game.id, game.card_status_known, game.has_cards)
+            if callable(getattr(e, "write_rows", None)):
+                e.write_rows(rows)
+            else:
+                for row in rows:
+                    e.write(*row)
+
+    def write_batch(self, batch):
+        """Write all the games in a GameBatch. Outputs that can write a batch get it as it is, and outputs that can write many rows get all its rows at once. The rest get one row at a time."""
+        self.drain()
+        rows = None
+        for e in self.exporter_list:
+            if callable(getattr(e, "write_batch", None)):
+                e.write_batch(batch)
+            elif callable(getattr(e, "write_rows", None)):
+                rows = rows if rows is not None else list(batch.rows())
+                e.write_rows(rows)
+            else:
+                for row in batch.rows():
+                    e.write(*row)
 
     def close(self):
+        self.drain()
         for e in self.exporter_list:
             if callable(getattr(e, "close", None)):
                 e.close()
 
     def flush(self):
+        self.drain()
         for e in self.exporter_list:
             if callable(getattr(e, "flush", None)):
                 e.flush()
 
+    def commit(self):
+        """Tell the outputs that all the games were written. Outputs writing to a temporary file move it over the target now."""
+        self.drain()
+        for e in self.exporter_list:
+            if callable(getattr(e, "commit", None)):
+                e.commit()
+
     class CSVFile:
 
-        def __init__(self, filename):
-            self.file = open(filename, mode="w", encoding='UTF-8', newline='')
+        def __init__(self, filename, atomic=False, append=False):
+            """When atomic is set the rows are written to a temporary file next to filename, which replaces filename only on commit(). This way filename can also be the input that is still being read.
+            When append is set the rows are added to the end of filename instead of replacing it. Used by incremental updates, see InputWatcher."""
+            self.filename = filename
+            self.temp_filename = None
+            if append:
+                self.file = open(filename, mode="a", encoding='UTF-8', newline='', buffering=Exporter.FILE_BUFFER)
+            elif atomic:
+                fd, self.temp_filename = tempfile.mkstemp(prefix=os.path.basename(filename) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(filename)))
+                self.file = open(fd, mode="w", encoding='UTF-8', newline='', buffering=Exporter.FILE_BUFFER)
+            else:
+                self.file = open(filename, mode="w", encoding='UTF-8', newline='', buffering=Exporter.FILE_BUFFER)
             self.file_writer = csv.writer(self.file)
 
         def close(self):
             self.file.close()
+            if self.temp_filename is not None:
+                # Never committed. The run was stopped before all the games were written, so the target is left as it was.
+                logging.warning("Output to %s was not completed. Discarding %s", self.filename, self.temp_filename)
+                os.remove(self.temp_filename)
+                self.temp_filename = None
+
+        def commit(self):
+            if self.temp_filename is None:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            os.replace(self.temp_filename, self.filename)
+            self.temp_filename = None
 
         def flush(self):
             """Source: https://stackoverflow.com/a/19756479/2842452"""
@@ -322,6 +757,14 @@ class Exporter:
             status = "" if not card_status_known else "TRUE" if has_cards else "FALSE"
             self.file_writer.writerow([name, appid, status])
 
+        def write_rows(self, rows):
+            self.file_writer.writerows((name, str(appid) if appid is not None else "", "" if not known else "TRUE" if has_cards else "FALSE") for name, appid, known, has_cards in rows)
+
+        def write_batch(self, batch):
+            status_text = {GameBatch.STATUS_UNKNOWN: "", GameBatch.STATUS_NO_CARDS: "FALSE", GameBatch.STATUS_HAS_CARDS: "TRUE"}
+            appids = (str(appid) if appid != GameBatch.NO_ID else "" for appid in batch.appids)
+            self.file_writer.writerows(zip(batch.names, appids, map(status_text.get, batch.status)))
+
     class Log:
 
         def __init__(self, level=logging.INFO):
@@ -333,17 +776,731 @@ class Exporter:
             status = "?" if not card_status_known else "TRUE" if has_cards else "FALSE"
             logging.log(self.level, "%s (%s): [%s]", name, appid, status)
 
-    class TextBox:
+        def write_rows(self, rows):
+            """A single log record for all the rows."""
+            if not logging.getLogger().isEnabledFor(self.level):
+                return
+            lines = ("%s (%s): [%s]" % (name, str(appid) if appid is not None else "?", "?" if not known else "TRUE" if has_cards else "FALSE") for name, appid, known, has_cards in rows)
+            logging.log(self.level, "\n".join(lines))
 
-        def __init__(self, box, index):
-            self.box = box
-            self.index = index
+    class Queue:
+        """Puts a line of text for each game into a queue.Queue. Used to hand the rows over to another thread, like the GUI's main loop, which displays them in batches."""
+
+        def __init__(self, queue):
+            self.queue = queue
 
         def write(self, name, appid, card_status_known, has_cards):
             appid = str(appid) if appid is not None else "?"
             status = "?" if not card_status_known else "TRUE" if has_cards else "FALSE"
-            self.box.insert(self.index, "%s (%s): [%s]\n" % (name, appid, status))
+            self.queue.put("%s (%s): [%s]\n" % (name, appid, status))
+
+    class Database:
+        """Writes the rows into a ResultsDB, under the given source name. Usually the name of the list file."""
 
+        def __init__(self, db, source):
+            self.db = db
+            self.source = source
+
+        def write(self, name, appid, card_status_known, has_cards):
+            self.write_rows([(name, appid, card_status_known, has_cards)])
+
+        def write_rows(self, rows):
+            self.db.upsert(self.source, rows)
+
+    class JSONLines:
+        """Writes one json object per line. See: http://jsonlines.org/ """
+
+        def __init__(self, filename, atomic=False):
+            """atomic is the same as in CSVFile."""
+            self.filename = filename
+            self.temp_filename = None
+            if atomic:
+                fd, self.temp_filename = tempfile.mkstemp(prefix=os.path.basename(filename) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(filename)))
+                self.file = open(fd, mode="w", encoding='UTF-8', buffering=Exporter.FILE_BUFFER)
+            else:
+                self.file = open(filename, mode="w", encoding='UTF-8', buffering=Exporter.FILE_BUFFER)
+
+        def close(self):
+            self.file.close()
+            if self.temp_filename is not None:
+                logging.warning("Output to %s was not completed. Discarding %s", self.filename, self.temp_filename)
+                os.remove(self.temp_filename)
+                self.temp_filename = None
+
+        def commit(self):
+            if self.temp_filename is None:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            os.replace(self.temp_filename, self.filename)
+            self.temp_filename = None
+
+        def flush(self):
+            self.file.flush()
+
+        def write(self, name, appid, card_status_known, has_cards):
+            self.write_rows([(name, appid, card_status_known, has_cards)])
+
+        def write_rows(self, rows):
+            self.file.write("".join(json.dumps({"name": name, "appid": appid, "has_cards": has_cards if known else None}) + "\n" for name, appid, known, has_cards in rows))
+
+    class GzipCSVFile:
+        """Same format as CSVFile, compressed with gzip."""
+
+        def __init__(self, filename, compresslevel=6, atomic=False):
+            """atomic is the same as in CSVFile."""
+            import gzip
+            import io
+            self.filename = filename
+            self.temp_filename = None
+            if atomic:
+                fd, self.temp_filename = tempfile.mkstemp(prefix=os.path.basename(filename) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(filename)))
+                self.raw = open(fd, mode="wb")
+            else:
+                self.raw = open(filename, mode="wb")
+            self.file = io.TextIOWrapper(gzip.GzipFile(fileobj=self.raw, mode="wb", compresslevel=compresslevel), encoding='UTF-8', newline='')
+            self.file_writer = csv.writer(self.file)
+
+        def close(self):
+            self.file.close()  # Writes the end of the gzip stream. The raw file stays open
+            self.raw.close()
+            if self.temp_filename is not None:
+                logging.warning("Output to %s was not completed. Discarding %s", self.filename, self.temp_filename)
+                os.remove(self.temp_filename)
+                self.temp_filename = None
+
+        def commit(self):
+            if self.temp_filename is None:
+                return
+            self.file.close()
+            self.raw.flush()
+            os.fsync(self.raw.fileno())
+            self.raw.close()
+            os.replace(self.temp_filename, self.filename)
+            self.temp_filename = None
+
+        def flush(self):
+            self.file.flush()
+
+        def write(self, name, appid, card_status_known, has_cards):
+            self.write_rows([(name, appid, card_status_known, has_cards)])
+
+        def write_rows(self, rows):
+            self.file_writer.writerows((name, str(appid) if appid is not None else "", "" if not known else "TRUE" if has_cards else "FALSE") for name, appid, known, has_cards in rows)
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on the file path + ".lock", held for the with block. Lets processes on one machine, like the shards of a run, share a file. Blocks until the lock is free."""
+    with open(path + ".lock", "a+b") as file:
+        if os.name == "nt":
+            import msvcrt
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after 10 seconds
+                    pass
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def write_file_atomic(path, text):
+    """Write text to path through a temporary file, so that readers never see a file that is half written."""
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+    with open(fd, "w", encoding='UTF-8') as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+
+class AliasTable:
+    """Names that the AppList doesn't know, or knows more than one app by, mapped to the right appid. Filled with the names Google resolves, see AppList.learn().
+    Kept in a json file of "name": "appid" pairs that can also be edited by hand. The names there can be written any way, they are simplified on load.
+    Merged into AppList.name_lookup when the AppList is loaded, so the next lists find these names offline. Runs that share the file, like shards, merge what they learn on save()"""
+    DEFAULT_PATH = "Aliases.json"
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.entries = {}  # simplified name -> appid
+        self.added = {}  # The entries added since the table was loaded. Written over what is in the file on save()
+        self.changed = False
+        if path is not None and os.path.exists(path):
+            self.entries = AliasTable.read(path)
+
+    @staticmethod
+    def read(path):
+        with open(path, encoding='UTF-8') as file:
+            try:
+                aliases = json.loads(file.read())
+            except json.decoder.JSONDecodeError:
+                logging.exception("Failed to parse the aliases in %s. Ignoring them.", path)
+                return {}
+        return {simplified_name(name): str(appid) for name, appid in aliases.items() if string_represent_int(str(appid))}
+
+    def get(self, name):
+        return self.entries.get(simplified_name(name))
+
+    def add(self, name, appid):
+        if self.entries.get(name) != str(appid):
+            self.entries[name] = str(appid)
+            self.added[name] = str(appid)
+            self.changed = True
+
+    def save(self, path=None):
+        """Write the table to its file, or to path. Sorted and indented, to make editing by hand easy. Also used to export the table to another machine."""
+        path = path if path is not None else self.path
+        if path is None or (path == self.path and not self.changed):
+            return
+        if path != self.path:
+            write_file_atomic(path, json.dumps(self.entries, indent=1, sort_keys=True, ensure_ascii=False))
+            return
+        with file_lock(path):
+            if os.path.exists(path):  # Names other runs learned in the meantime, and edits by hand, are kept
+                self.entries = AliasTable.read(path)
+                self.entries.update(self.added)
+            write_file_atomic(path, json.dumps(self.entries, indent=1, sort_keys=True, ensure_ascii=False))
+        self.added = {}
+        self.changed = False
+
+    def merge(self, path, overwrite=False):
+        """Import the aliases exported from another machine. Names already in the table keep their appid, unless overwrite is set. Returns the number of new or changed names."""
+        count = 0
+        for name, appid in AliasTable.read(path).items():
+            if (overwrite or name not in self.entries) and self.entries.get(name) != appid:
+                self.entries[name] = appid
+                self.added[name] = appid
+                count += 1
+        self.changed = self.changed or count > 0
+        return count
+
+
+class NegativeCache:
+    """Remembers names and appids that failed to resolve, so that later runs don't spend Google queries and appdetails calls on them again.
+    Every entry expires after a time that depends on the reason of the failure. Temporary failures, like timeouts, are never stored."""
+    DEFAULT_PATH = "NegativeCache.json"
+
+    # Kinds of keys
+    NAME = "name"  # Simplified names that Google couldn't resolve
+    APP = "app"  # Appids whose details couldn't be fetched
+
+    # Reasons
+    NOT_FOUND = "not found"
+    DELISTED = "delisted"
+    REGION_LOCKED = "region locked"
+    PARSE_ERROR = "parse error"
+
+    DAY = 24 * 60 * 60
+    DEFAULT_TTL = {NOT_FOUND: 7 * DAY, DELISTED: 30 * DAY, REGION_LOCKED: 7 * DAY, PARSE_ERROR: 1 * DAY}
+
+    def __init__(self, path=DEFAULT_PATH, ttl=None):
+        """ttl optionally overrides some of DEFAULT_TTL. Seconds by reason."""
+        self.path = path
+        self.ttl = dict(NegativeCache.DEFAULT_TTL)
+        self.ttl.update(ttl or {})
+        self.entries = {NegativeCache.NAME: {}, NegativeCache.APP: {}}  # kind -> key -> [reason, expiry time]
+        if path is not None and os.path.exists(path):
+            with open(path, encoding='UTF-8') as file:
+                try:
+                    self.entries.update(json.loads(file.read()))
+                except json.decoder.JSONDecodeError:
+                    logging.exception("Failed to parse the negative cache %s. Starting with an empty one.", path)
+
+    def get(self, kind, key):
+        """The reason the key recently failed, or None if it didn't or if the entry expired."""
+        entry = self.entries[kind].get(str(key))
+        if entry is None:
+            return None
+        if entry[1] < time.time():
+            del self.entries[kind][str(key)]
+            return None
+        return entry[0]
+
+    def add(self, kind, key, reason):
+        self.entries[kind][str(key)] = [reason, time.time() + self.ttl[reason]]
+
+    def save(self):
+        """Write the cache to its file. Expired entries are dropped."""
+        if self.path is None:
+            return
+        now = time.time()
+        entries = {kind: {key: entry for key, entry in keys.items() if entry[1] >= now} for kind, keys in self.entries.items()}
+        with open(self.path, "w", encoding='UTF-8') as file:
+            file.write(json.dumps(entries))
+
+
+class GoogleQuota:
+    """Keeps track of how many Google searches every key made today, in a file shared by all the runs. Rotates between the keys and stops handing them out once the
+    daily quota of all of them is used up, instead of wasting requests that will fail. Google resets the quota at midnight, Pacific time.
+    The last searches of the day are kept for names that have no match in the AppList at all. Names that match several apps have the AppList to fall back on, see acquire()"""
+    DEFAULT_PATH = "GoogleQuota.json"
+    DAILY_LIMIT = 100  # Free searches per key per day
+    RESERVE = 0.2  # Part of the daily quota of all the keys that names with a fallback can't use
+    EXHAUSTED = "quota exhausted"  # Returned by Game.__search_id_google_api__ when Google refuses because of the quota
+
+    def __init__(self, keys, path=DEFAULT_PATH, daily_limit=DAILY_LIMIT):
+        """keys is a list of {"cx": ..., "key": ...} objects. See load_config_file()"""
+        self.keys = keys
+        self.path = path
+        self.daily_limit = daily_limit
+        self.reserve = int(GoogleQuota.RESERVE * daily_limit * len(keys))  # Searches kept for names without a fallback. Set to 0 when none of them are left to come, like in a scheduled run
+        self.usage = {}  # day -> key -> searches made
+        self.load()
+
+    def load(self):
+        """Read the counts from the file. They change while the run goes on, when other runs on this machine, like shards, share the file."""
+        if self.path is not None and os.path.exists(self.path):
+            with open(self.path, encoding='UTF-8') as file:
+                try:
+                    self.usage = json.loads(file.read())
+                except json.decoder.JSONDecodeError:
+                    logging.exception("Failed to parse %s. Assuming no searches were made today.", self.path)
+
+    @contextmanager
+    def update(self):
+        """Change the counts inside the with block. The file is locked, read again before the block and written after it, so runs sharing it never lose each other's searches."""
+        if self.path is None:
+            yield
+            return
+        with file_lock(self.path):
+            self.load()
+            yield
+            self.save()
+
+    @staticmethod
+    def today():
+        return time.strftime("%Y-%m-%d", time.gmtime(time.time() - 8 * 60 * 60))  # Pacific Standard Time
+
+    def used(self, credentials):
+        return self.usage.get(GoogleQuota.today(), {}).get(credentials["key"], 0)
+
+    def remaining(self):
+        """Searches left today, over all the keys."""
+        return sum(max(self.daily_limit - self.used(k), 0) for k in self.keys)
+
+    def acquire(self, fallback=False):
+        """Count a search against the key with the most searches left, and return it. None if all the keys are used up for today.
+        fallback is for names that can do without the search. They get None once only the reserved searches are left."""
+        if not self.keys:
+            return None
+        with self.update():
+            if fallback and self.remaining() <= self.reserve:
+                return None
+            credentials = min(self.keys, key=self.used)
+            if self.used(credentials) >= self.daily_limit:
+                return None
+            today = self.usage.setdefault(GoogleQuota.today(), {})
+            today[credentials["key"]] = today.get(credentials["key"], 0) + 1
+        return credentials
+
+    def exhaust(self, credentials):
+        """Google said that the key is used up, whatever our count says. Don't use it again today."""
+        with self.update():
+            self.usage.setdefault(GoogleQuota.today(), {})[credentials["key"]] = self.daily_limit
+
+    def save(self):
+        if self.path is None:
+            return
+        today = GoogleQuota.today()
+        write_file_atomic(self.path, json.dumps({today: self.usage.get(today, {})}))  # Older days don't matter anymore
+
+
+class ResultsDB:
+    """SQLite database holding the results of all the runs. Games are indexed by appid, simplified name and the list (source) they came from.
+    Used both as an output of Exporter (see Exporter.Database) and as a cache that Game.find_id and Game.fetch_card_info consult before going online."""
+    DEFAULT_PATH = "Results.db"
+
+    def __init__(self, path=DEFAULT_PATH):
+        import sqlite3
+        self.path = path
+        self.lock = threading.Lock()  # The GUI writes from its worker thread
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS games (source TEXT NOT NULL, name TEXT NOT NULL, simplified_name TEXT NOT NULL, appid TEXT, "
+                                    "card_status_known INTEGER NOT NULL DEFAULT 0, has_cards INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL, "
+                                    "PRIMARY KEY (source, simplified_name))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS games_appid ON games (appid)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS games_simplified_name ON games (simplified_name)")
+            # Card status of every app checked so far, whatever list it came from. Filled by CardCrawler and by every online fetch.
+            # has_cards is NULL for unavailable apps, and reason says why. See NegativeCache
+            self.connection.execute("CREATE TABLE IF NOT EXISTS cards (appid TEXT PRIMARY KEY, has_cards INTEGER, type TEXT, checked REAL NOT NULL, reason TEXT)")
+            if "reason" not in [column[1] for column in self.connection.execute("PRAGMA table_info(cards)")]:
+                # Written by an older version, which kept the reason in the type column
+                self.connection.execute("ALTER TABLE cards ADD COLUMN reason TEXT")
+                self.connection.execute("UPDATE cards SET reason = type, type = NULL WHERE has_cards IS NULL")
+
+    def close(self):
+        self.connection.close()
+
+    def store_cards(self, rows):
+        """Insert or update the card index. rows are (appid, has_cards, type, reason) tuples. has_cards and type are None if the store has no details for the app, and reason says why."""
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO cards (appid, has_cards, type, checked, reason) VALUES (?, ?, ?, ?, ?)",
+                                        ((str(appid), int(has_cards) if has_cards is not None else None, app_type, now, reason) for appid, has_cards, app_type, reason in rows))
+
+    def checked_apps(self, max_age):
+        """Set of the appids in the card index that were checked in the last max_age seconds."""
+        with self.lock:
+            rows = self.connection.execute("SELECT appid FROM cards WHERE checked >= ?", (time.time() - max_age,)).fetchall()
+        return {row[0] for row in rows}
+
+    def card_index_size(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*), COUNT(has_cards), SUM(has_cards) FROM cards").fetchone()
+
+    def upsert(self, source, rows):
+        """Insert or update many games in one transaction. rows are (name, appid, card_status_known, has_cards) tuples, like the ones the exporters receive.
+        Known information is never replaced by unknown information from a later, less successful, run."""
+        now = time.time()
+        values = ((source, name, simplified_name(name), str(appid) if appid is not None else None, int(known), int(known and has_cards), now) for name, appid, known, has_cards in rows)
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (source, simplified_name) DO UPDATE SET "
+                                        "name = excluded.name, appid = COALESCE(excluded.appid, appid), "
+                                        "has_cards = CASE WHEN excluded.card_status_known THEN excluded.has_cards ELSE has_cards END, "
+                                        "card_status_known = MAX(card_status_known, excluded.card_status_known), updated = excluded.updated", values)
+
+    def lookup_id(self, simplified):
+        """The appid most recently found for a game with this simplified name, in any list. None if it was never found."""
+        with self.lock:
+            row = self.connection.execute("SELECT appid FROM games WHERE simplified_name = ? AND appid IS NOT NULL ORDER BY updated DESC LIMIT 1", (simplified,)).fetchone()
+        return row[0] if row is not None else None
+
+    def lookup_cards(self, appid):
+        """Whatever the app has cards, as found by a previous run or by the crawler. None if it is unknown."""
+        with self.lock:
+            row = self.connection.execute("SELECT has_cards FROM games WHERE appid = ? AND card_status_known ORDER BY updated DESC LIMIT 1", (str(appid),)).fetchone()
+            if row is None:
+                row = self.connection.execute("SELECT has_cards FROM cards WHERE appid = ? AND has_cards IS NOT NULL", (str(appid),)).fetchone()
+        return bool(row[0]) if row is not None else None
+
+    def sources_with_cards(self):
+        """List of (source, number of games with cards) for every list that contains games with cards."""
+        with self.lock:
+            return self.connection.execute("SELECT source, COUNT(*) FROM games WHERE has_cards GROUP BY source ORDER BY source").fetchall()
+
+    def sources_of(self, name):
+        """List of (source, name, appid, card_status_known, has_cards) for every list containing the game."""
+        with self.lock:
+            return self.connection.execute("SELECT source, name, appid, card_status_known, has_cards FROM games WHERE simplified_name = ? ORDER BY source", (simplified_name(name),)).fetchall()
+
+    def games_in(self, source):
+        """List of (name, appid, card_status_known, has_cards) for every game in the list."""
+        with self.lock:
+            return self.connection.execute("SELECT name, appid, card_status_known, has_cards FROM games WHERE source = ? ORDER BY name", (source,)).fetchall()
+
+
+class CardCrawler:
+    """Walks the whole AppList and fills the card index of a ResultsDB, within the same rate limits as a run. Game.fetch_card_info then answers from the index, offline.
+    Resumable: apps checked in the last RECHECK_AGE seconds are skipped, so a stopped crawl continues where it was and a finished one only refreshes old entries.
+    Games come first. Apps whose names suggest soundtracks, DLC, demos, tools and such come last."""
+    RECHECK_AGE = 30 * 24 * 60 * 60
+    NOT_GAME_WORDS = frozenset(["soundtrack", "ost", "dlc", "demo", "trailer", "server", "sdk", "playtest", "beta", "test", "editor", "tool", "tools", "video", "pack", "wallpaper", "artbook"])
+    BATCH_SIZE = 50  # Entries stored together in one transaction
+
+    def __init__(self, results, app_list, delayer, cancel=None):
+        self.results = results
+        self.app_list = app_list
+        self.delayer = delayer
+        self.cancel = cancel if cancel is not None else Cancellation()
+        self.checked = 0
+
+    def order(self):
+        """Appids still to be checked, games first."""
+        checked = self.results.checked_apps(CardCrawler.RECHECK_AGE)
+        pending = [(appid, name) for appid, name in self.app_list.id_lookup.items() if str(appid) not in checked]
+        pending.sort(key=lambda pair: (not CardCrawler.NOT_GAME_WORDS.isdisjoint(simplified_name(pair[1]).split()), pair[0]))
+        return [appid for appid, name in pending]
+
+    def crawl(self, limit=None):
+        """Check up to limit apps. Returns the number of apps checked. Stops early when the Cancellation is cancelled, or on Ctrl+C."""
+        order = self.order()
+        logging.info("Card index crawl: %d apps to check", len(order))
+        pending = []
+        try:
+            for appid in order[:limit]:
+                data, reason = Game.__app_details_steam_api__(str(appid), cancel=self.cancel)
+                if data is not None:
+                    pending.append((appid, Game.details_have_cards(data), data.get("type"), None))
+                elif reason is not None:
+                    pending.append((appid, None, None, reason))  # Unavailable. Not retried until RECHECK_AGE passes
+                self.checked += 1
+                if len(pending) >= CardCrawler.BATCH_SIZE:
+                    self.results.store_cards(pending)
+                    pending = []
+                    logging.info("Card index crawl: %d apps checked", self.checked)
+                self.delayer.tick(self.cancel)
+        except (KeyboardInterrupt, Cancelled):
+            logging.info("Card index crawl stopped")
+        self.results.store_cards(pending)
+        return self.checked
+
+    def start(self, limit=None):
+        """Crawl on a background thread. Stop it with self.cancel.cancel(). Give it the Delayer of the run it goes along with, to keep the rate limits of a single run. See update()"""
+        thread = threading.Thread(target=self.crawl, args=(limit,), daemon=True)
+        thread.start()
+        return thread
+
+
+class Cancelled(Exception):
+    """Raised by the waits and network reads of a run whose Cancellation was cancelled."""
+
+
+class Cancellation:
+    """Lets one thread stop the work of another within a fraction of a second. The sleeps of Delayer and the network reads check it, not only the processing loop."""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        if self.event.is_set():
+            raise Cancelled()
+
+    def sleep(self, seconds):
+        """Same as time.sleep, but raises Cancelled as soon as the work is cancelled."""
+        if self.event.wait(seconds):
+            raise Cancelled()
+
+    def cancel_after(self, seconds):
+        """Cancel once seconds pass. Used for the deadline of a run: the work stops the same way it does when the user stops it."""
+        def expire():
+            if not self.cancelled:
+                logging.warning("The deadline of the run has passed. Stopping.")
+                self.cancel()
+        timer = threading.Timer(seconds, expire)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+
+CANCEL_POLL_TIME = 0.05  # How often read_url checks whatever it was cancelled
+
+
+class Timeouts:
+    """Picks the timeout of every request from the latency measured so far to the same host: FACTOR times the PERCENTILE of the last SAMPLES successful requests,
+    within MINIMUM and MAXIMUM. Until there are enough samples the default timeout of the request is used. A host that answers in 200 ms doesn't get 20 seconds to hang.
+    Also caps the total time spent on one game, see game(). Shared by all the threads, through TIMEOUTS."""
+    PERCENTILE = 0.95
+    FACTOR = 3
+    MINIMUM = 2
+    MAXIMUM = 60
+    SAMPLES = 200
+    MIN_SAMPLES = 10
+
+    def __init__(self, game_time=None):
+        """game_time is an optional limit, in seconds, to the time all the requests of one game may take together."""
+        self.game_time = game_time
+        self.latency = {}  # host -> deque of seconds
+        self.lock = threading.Lock()
+        self.local = threading.local()  # game_end of the game the thread is working on
+
+    def record(self, host, seconds):
+        """Add a sample. A request that timed out is recorded too, with the time it was given: its latency was at least that long.
+        Otherwise a host that slowed down past the timeout would never get a longer one."""
+        with self.lock:
+            self.latency.setdefault(host, collections.deque(maxlen=Timeouts.SAMPLES)).append(seconds)
+
+    def adaptive(self, host):
+        """The timeout the latency of host calls for, or None if there are not enough samples yet."""
+        with self.lock:
+            samples = sorted(self.latency.get(host, ()))
+        if len(samples) < Timeouts.MIN_SAMPLES:
+            return None
+        high = samples[int(Timeouts.PERCENTILE * (len(samples) - 1))]
+        return min(max(high * Timeouts.FACTOR, Timeouts.MINIMUM), Timeouts.MAXIMUM)
+
+    def timeout(self, host, default=None):
+        """The timeout for the next request to host. Raises socket.timeout right away if the time of the current game is used up."""
+        adaptive = self.adaptive(host)
+        timeout_time = adaptive if adaptive is not None else default
+        game_end = getattr(self.local, "game_end", None)
+        if game_end is not None:
+            left = game_end - time.monotonic()
+            if left <= 0:
+                raise timeout("The time limit of the game is used up")
+            timeout_time = left if timeout_time is None else min(timeout_time, left)
+        return timeout_time
+
+    @contextmanager
+    def game(self):
+        """Every request made by this thread inside the with block counts against game_time."""
+        self.local.game_end = time.monotonic() + self.game_time if self.game_time else None
+        try:
+            yield
+        finally:
+            self.local.game_end = None
+
+
+TIMEOUTS = Timeouts()  # Used by read_url(). game_time is set by load_config_file()
+
+
+def read_url(req, timeout_time=None, cancel=None, download=False):
+    """Same as urlopen(req).read(). With a Cancellation the request is made on a helper thread, and Cancelled is raised as soon as the work is cancelled.
+    The helper thread is left to finish on its own. Its result is thrown away.
+    timeout_time is only the default. The actual timeout comes from TIMEOUTS, and also limits the whole request, not only every read, when cancel is given.
+    download is for big downloads, like the AppList. timeout_time is then used as it is, and only limits every read."""
+    import urllib.request
+    host = urllib.parse.urlsplit(req.full_url).netloc
+    if not download:
+        timeout_time = TIMEOUTS.timeout(host, timeout_time)
+    start = time.monotonic()
+    if cancel is None:
+        try:
+            with urllib.request.urlopen(req, timeout=timeout_time) as f:
+                data = f.read()
+        except urllib.error.URLError as e:
+            if isinstance(e.reason, timeout):  # Timeouts while connecting come wrapped
+                if not download:
+                    TIMEOUTS.record(host, time.monotonic() - start)
+                raise e.reason
+            raise
+        except timeout:
+            if not download:
+                TIMEOUTS.record(host, time.monotonic() - start)
+            raise
+        if not download:
+            TIMEOUTS.record(host, time.monotonic() - start)
+        return data
+
+    cancel.check()
+    result = {}
+
+    def target():
+        try:
+            with urllib.request.urlopen(req, timeout=timeout_time) as f:
+                result["data"] = f.read()
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    while thread.is_alive():
+        thread.join(CANCEL_POLL_TIME)
+        cancel.check()
+        if not download and timeout_time is not None and time.monotonic() - start > timeout_time + CANCEL_POLL_TIME:
+            TIMEOUTS.record(host, time.monotonic() - start)
+            raise timeout("No complete answer from %s in %.1f seconds" % (host, timeout_time))  # A slow trickle of data never trips the timeout of the socket
+    if "error" in result:
+        error = result["error"]
+        error = error.reason if isinstance(error, urllib.error.URLError) and isinstance(error.reason, timeout) else error
+        if isinstance(error, timeout) and not download:
+            TIMEOUTS.record(host, time.monotonic() - start)
+        raise error
+    if not download:
+        TIMEOUTS.record(host, time.monotonic() - start)
+    return result["data"]
+
+
+class Progress:
+    """Keeps track of how far a run is. Counts the games by how they were resolved, measures the throughput over the last few minutes and projects when the run will end.
+    Written to by the thread processing the games, read by any other thread."""
+    CACHED = "cached"  # Card status was already known from the input
+    OFFLINE = "offline"  # Resolved without accessing the net
+    NETWORK = "network"  # Accessed the net
+    FAILED = "failed"  # Id or card status couldn't be found
+
+    def __init__(self, total=None, delayer=None, window=300):
+        """total is the number of games in the run, if known. delayer is the Delayer of the run, used to project the time network lookups will take."""
+        self.total = total
+        self.delayer = delayer
+        self.window = window
+        self.counts = {Progress.CACHED: 0, Progress.OFFLINE: 0, Progress.NETWORK: 0, Progress.FAILED: 0}
+        self.done = 0
+        self.start_time = time.monotonic()
+        self.recent = collections.deque()  # Times at which games were done, within the last window seconds
+        self.lock = threading.Lock()
+        self.last_log = 0
+
+    def record(self, kind, failed=False):
+        now = time.monotonic()
+        with self.lock:
+            self.done += 1
+            self.counts[kind] += 1
+            if failed:
+                self.counts[Progress.FAILED] += 1
+            self.recent.append(now)
+            while self.recent and self.recent[0] < now - self.window:
+                self.recent.popleft()
+
+    def record_game(self, game, accessed_net):
+        """Record a game that went through resolve()"""
+        self.record(Progress.NETWORK if accessed_net else Progress.OFFLINE, failed=not game.card_status_known)
+
+    def throughput(self):
+        """Games per minute, over the last window seconds"""
+        with self.lock:
+            if not self.recent:
+                return 0.0
+            elapsed = max(time.monotonic() - max(self.recent[0], self.start_time), 1e-3)
+            return len(self.recent) * 60 / elapsed
+
+    def eta(self):
+        """Seconds until the run ends, or None if it can't be told yet."""
+        if self.total is None:
+            return None
+        remaining = max(self.total - self.done, 0)
+        rate = self.throughput()
+        estimate = remaining * 60 / rate if rate > 0 else None
+
+        # Every network access is followed by a sleep, whatever the throughput so far says. The part of the games that went online so far tells how many more will.
+        with self.lock:
+            resolved = self.counts[Progress.OFFLINE] + self.counts[Progress.NETWORK]
+            network_share = self.counts[Progress.NETWORK] / resolved if resolved else None
+        if self.delayer is not None and network_share is not None:
+            sleep_per_access = self.delayer.short + self.delayer.long / self.delayer.count
+            floor = remaining * network_share * sleep_per_access
+            estimate = floor if estimate is None else max(estimate, floor)
+        return estimate
+
+    def summary(self):
+        percent = " (%.1f%%)" % (100.0 * self.done / self.total) if self.total else ""
+        total = "/%d" % self.total if self.total is not None else ""
+        eta = self.eta()
+        eta_text = format_duration(eta) if eta is not None else "?"
+        with self.lock:
+            counts = dict(self.counts)
+        return "%d%s%s | %.1f games/min | ETA %s | cached %d, offline %d, network %d, failed %d" % (
+            self.done, total, percent, self.throughput(), eta_text, counts[Progress.CACHED], counts[Progress.OFFLINE], counts[Progress.NETWORK], counts[Progress.FAILED])
+
+    def log(self, interval=10):
+        """Log the summary, at most once every interval seconds."""
+        now = time.monotonic()
+        if now - self.last_log >= interval:
+            self.last_log = now
+            logging.info("Progress: %s", self.summary())
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def count_lines(path):
+    """Number of non-empty lines in the file. Fast, doesn't parse anything. Used as the total of a Progress."""
+    count = 0
+    with open(path, "rb") as file:
+        for line in file:
+            if line.strip(b"\r\n"):
+                count += 1
+    return count
 
 
 class Delayer:
@@ -352,30 +1509,101 @@ class Delayer:
         self.i = long_sleep_count
         self.short = short_sleep_time
         self.long = long_sleep_time
+        self.lock = threading.Lock()
+
+    def tick(self, cancel=None):
+        """Sleep between accesses to the net. Raises Cancelled as soon as cancel is cancelled, instead of sleeping to the end.
+        Threads sharing a Delayer take their sleeps one after the other, so together they access the net no more often than a single thread would. See CardCrawler.start()"""
+        while not self.lock.acquire(timeout=CANCEL_POLL_TIME):
+            if cancel is not None:
+                cancel.check()
+        try:
+            sleep = cancel.sleep if cancel is not None else time.sleep
+            sleep(self.short)
+            self.i -= 1
+            if self.i <= 0:
+                self.i = self.count
+                logging.info("Accessed the internet %d times. Taking a short break to avoid overwhelming APIs.", self.count)
+                sleep(self.long)
+        finally:
+            self.lock.release()
+
+
+class LazyQueueHandler(logging.Handler):
+    """Hands the log records over to a QueueListener thread as they are. Unlike logging.handlers.QueueHandler, the message isn't formatted here but by the listener's handlers.
+    The logging thread only pays for creating the record and putting it in the queue. Arguments of the log calls are formatted later, so they shouldn't be changed after the call.
+    Closing the handler, for example by logging.shutdown(), stops the listener after it wrote everything that is in the queue."""
+
+    def __init__(self, *handlers):
+        from logging.handlers import QueueListener  # Imported here. logging.handlers takes longer to import than the rest of this module.
+        from queue import SimpleQueue
+        super().__init__()
+        self.queue = SimpleQueue()
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def emit(self, record):
+        self.queue.put_nowait(record)
 
-    def tick(self):
-        time.sleep(self.short)
-        self.i -= 1
-        if self.i <= 0:
-            self.i = self.count
-            logging.info("Accessed the internet %d times. Taking a short break to avoid overwhelming APIs.", self.count)
-            time.sleep(self.long)
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
 
 
-def init_log(filename=None, console=False, level=logging.WARNING):
+class ModuleLevelFilter(logging.Filter):
+    """Per module log levels. levels maps module names (like "Main" or "GUI") or logger names to the lowest level that passes. Other records need default_level."""
+
+    def __init__(self, levels, default_level):
+        super().__init__()
+        self.levels = levels
+        self.default_level = default_level
+
+    def filter(self, record):
+        return record.levelno >= self.levels.get(record.module, self.levels.get(record.name, self.default_level))
+
+
+def init_log(filename=None, console=False, level=logging.WARNING, queued=False, levels=None):
+    """queued writes the log on a background thread, see LazyQueueHandler. Logging then costs the calling thread almost nothing, at any level.
+    levels is an optional {module name: level} dict. See ModuleLevelFilter."""
     logger = logging.getLogger()
+    handlers = []
 
     if filename is not None:
         handler = logging.FileHandler(filename, encoding="utf-8", mode='w')
         handler.setFormatter(logging.Formatter(fmt='%(asctime)s     %(levelname)s:%(message)s', datefmt="%Y-%m-%d %H:%M:%S"))
-        logger.addHandler(handler)
+        handlers.append(handler)
 
     if console:  # False or None means no output. True means syso output. Instance of stream means output to the stream.
         stream = syso if console is True else console
         handler = logging.StreamHandler(stream)
+        handlers.append(handler)
+
+    if queued and handlers:
+        handlers = [LazyQueueHandler(*handlers)]
+    for handler in handlers:
+        if levels:
+            handler.addFilter(ModuleLevelFilter(levels, level))
         logger.addHandler(handler)
 
-    logger.setLevel(level)
+    # Records below every configured level are dropped by the logger itself, before a record is even created
+    logger.setLevel(min([level] + list(levels.values())) if levels else level)
+
+
+def parse_log_levels(values):
+    """Parse the --log-level command line options. Each is LEVEL, for the default level, or MODULE=LEVEL. Returns (default level or None, {module: level})"""
+    default, levels = None, {}
+    for value in values or []:
+        module, _, name = value.rpartition("=")
+        level = logging.getLevelName(name.upper())
+        if not isinstance(level, int):
+            raise ValueError("Unknown log level " + name)
+        if module:
+            levels[module] = level
+        else:
+            default = level
+    return default, levels
 
 
 def string_represent_int(s):
@@ -393,74 +1621,735 @@ def load_config_file(path):
         config = json.loads(file.read())
         if config["key"] == "YOUR_KEY_HERE":
             config["key"] = None
+
+        # Any number of keys can be listed under "keys", as {"cx": ..., "key": ...} objects. The single "cx" and "key" are the first of them.
+        keys = [{"cx": config["cx"], "key": config["key"]}] if config["key"] is not None else []
+        keys += [k for k in config.get("keys", []) if k.get("key") not in (None, "YOUR_KEY_HERE")]
+        config["keys"] = keys
+        if keys:
+            config["cx"], config["key"] = keys[0]["cx"], keys[0]["key"]
+        else:
             logging.warning("No Google API key is set. Using google search is impossible.")
 
+        # Optional. Point the tool at other servers, like MockServer.py when testing.
+        Game.GOOGLE_API_URL = config.get("google_api_url", Game.GOOGLE_API_URL)
+        Game.APP_DETAILS_URL = config.get("app_details_url", Game.APP_DETAILS_URL)
+        AppList.FETCH_URL = config.get("applist_url", AppList.FETCH_URL)
+        TIMEOUTS.game_time = config.get("game_time_limit", TIMEOUTS.game_time)  # Seconds. No limit by default
         return config
 
 
-def users_game_gen(path):
-    """Reads the file located in path and creates a Game object for each game written there. One game name per line."""
+def shard_of(simplified, shard_count):
+    """Deterministically assigns a game to one of shard_count shards, based on its simplified name. The same on every machine and every run."""
+    return zlib.crc32(simplified.encode("utf-8")) % shard_count
+
+
+def shard_path(path, index):
+    """The file of shard index, for a file shared by all the runs. NegativeCache.json -> NegativeCache.0.json"""
+    root, extension = os.path.splitext(path)
+    return "%s.%d%s" % (root, index, extension)
+
+
+def merge_shards(path_in, shard_paths, path_out):
+    """Recombine the outputs of runs over the shards of path_in into a single csv file, in the order of path_in.
+    Games missing from the shard outputs (for example because their lookup failed) are copied from path_in as they are."""
+    found = {}
+    for shard_path in shard_paths:
+        for row in users_row_gen(shard_path):
+            found.setdefault(simplified_name(row[0]), collections.deque()).append(row)
+
+    with closing(Exporter(Exporter.CSVFile(path_out), buffer_size=1000)) as export:
+        for row in users_row_gen(path_in):
+            rows = found.get(simplified_name(row[0]))
+            export.write_row(*(rows.popleft() if rows else row))
+
 
+USERS_STATUS_VALUES = frozenset(["TRUE", "FALSE", ""])
+
+
+def parse_line(line):
+    """Parse one line of input into a (name, appid, card_status_known, has_cards) tuple, like the ones the exporters receive. Returns None for empty lines.
+    Lines in the format of our own output ("name,appid,TRUE/FALSE/") are recognized with a single rsplit. Only lines containing quotes go through the csv module."""
+    line = line.rstrip("\r\n")
+    if not line:
+        return None
+
+    if '"' in line:
+        row = next(csv.reader([line]), [])
+        if len(row) == 0:
+            return None
+    else:
+        row = line.rsplit(",", 2)  # Splitting only the last 2 fields is enough. Joining the name fields back (see below) only removes the commas.
+
+    if len(row) >= 3 and row[-1].upper() in USERS_STATUS_VALUES and (row[-2].isdecimal() or string_represent_int(row[-2])):
+        """The line scanned is in the same format as the output of our program"""
+        name = "".join(row[:-2]) if '"' in line else row[0].replace(",", "")
+        status = row[-1].upper()
+        return name, row[-2], status != "", status == "TRUE"
+    else:
+        """The line wasn't written by us. Assuming it is all one long name"""
+        name = "".join(row) if '"' in line else line.replace(",", "")
+        return name, None, False, False
+
+
+def users_row_gen(path):
+    """Reads the file located in path and yields a (name, appid, card_status_known, has_cards) tuple for each game written there. No Game objects are created.
+    Rows whose card status is already known need no more work and can be given to Exporter.write_row as they are."""
     with open(path, encoding='UTF-8', newline="") as file:
-        file_reader = csv.reader(file)
-        for row in file_reader:
-            if len(row) == 0:
-                continue
+        for line in file:
+            row = parse_line(line)
+            if row is not None:
+                yield row
+
+
+class MappedInput:
+    """Reads an input list through a memory map instead of Python's text I/O. Lines are split on the raw bytes and only the parts that are needed are decoded.
+    Also supports starting at any byte offset, for resuming a run. Usage:
+        with closing(MappedInput(path)) as mapped:
+            for row in mapped.rows():
+                ...
+    """
+    STATUS_VALUES = frozenset([b"TRUE", b"FALSE", b""])
+    CHUNK_SIZE = 1 << 20
 
-            if len(row) >= 3 and string_represent_int(row[-2]) and row[-1].upper() in ["TRUE", "FALSE", ""]:
-                """The line scanned is in the same format as the output of our program"""
-                name = "".join(row[:-2])
-                game = Game(name)
-                game.id = row[-2]
-                game.card_status_known = row[-1] != ""
-                game.has_cards = game.card_status_known and row[-1].upper() == "TRUE"
+    def __init__(self, path):
+        import mmap
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b""  # Empty files can't be mapped
+        self.size = size
+
+    def close(self):
+        if not isinstance(self.map, bytes):
+            self.map.close()
+        self.file.close()
+
+    def line_start(self, offset):
+        """The offset of the first line that starts at offset or after it."""
+        if offset <= 0:
+            return 0
+        if offset >= self.size:
+            return self.size
+        nl = self.map.find(b"\n", offset - 1)
+        return self.size if nl < 0 else nl + 1
+
+    def chunks(self, start=0, end=None):
+        """Yields lists of about CHUNK_SIZE bytes worth of whole lines, covering every line that starts between start and end.
+        Splitting a whole chunk at once is much faster than looking for every line break separately."""
+        end = self.size if end is None else min(end, self.size)
+        pos = self.line_start(start)
+        while pos < end:
+            limit = pos + MappedInput.CHUNK_SIZE
+            if limit >= end:
+                nl = self.map.find(b"\n", end - 1)  # The end of the last line starting before end
             else:
-                """The line wasn't written by us. Assuming it is all one long name"""
-                name = "".join(row)
-                game = Game(name)
-            yield game
+                nl = self.map.rfind(b"\n", pos, limit)
+                nl = nl if nl >= 0 else self.map.find(b"\n", limit)  # A line longer than a chunk
+            chunk_end = self.size if nl < 0 else nl + 1
+            yield self.map[pos:chunk_end].split(b"\n")[:-1] if nl >= 0 else self.map[pos:chunk_end].split(b"\n")
+            pos = chunk_end
+
+    def rows_with_offsets(self, start=0, end=None):
+        """Yields (offset after the line, row) for every line that starts between start and end. The offset can be given back as start to resume after that line."""
+        pos = self.line_start(start)
+        parse = MappedInput.parse_line
+        for lines in self.chunks(start, end):
+            for line in lines:
+                pos = min(pos + len(line) + 1, self.size)
+                row = parse(line)
+                if row is not None:
+                    yield pos, row
+
+    def rows(self, start=0, end=None):
+        """Same as users_row_gen()"""
+        parse = MappedInput.parse_line
+        for lines in self.chunks(start, end):
+            for row in map(parse, lines):
+                if row is not None:
+                    yield row
+
+    @staticmethod
+    def parse_line(line):
+        """Same as parse_line(), working on the raw bytes of the line."""
+        line = line.rstrip(b"\r")
+        if not line:
+            return None
+        if b'"' in line:
+            return parse_line(line.decode("utf-8"))
+
+        row = line.rsplit(b",", 2)
+        if len(row) == 3 and row[2].upper() in MappedInput.STATUS_VALUES and row[1].isdigit():
+            status = row[2].upper()
+            return row[0].replace(b",", b"").decode("utf-8"), row[1].decode("ascii"), status != b"", status == b"TRUE"
+        if len(row) == 3 and row[2].upper() in MappedInput.STATUS_VALUES:
+            return parse_line(line.decode("utf-8"))  # Unusual appid, like " 12". Leave it to the text parser.
+        return line.replace(b",", b"").decode("utf-8"), None, False, False
+
+
+def game_from_row(name, appid, card_status_known, has_cards):
+    game = Game(name)
+    game.id = appid
+    game.card_status_known = card_status_known
+    game.has_cards = has_cards
+    return game
+
+
+def users_game_gen(path):
+    """Reads the file located in path and creates a Game object for each game written there. One game name per line."""
+    for row in users_row_gen(path):
+        yield game_from_row(*row)
 
 
 def users_game_list(path):
     return list(users_game_gen(path))
 
 
-def main():
-    path_in = "Test/big_list.txt"
-    path_out = "Test/big_list_out.csv"
+def resolve(game, app_list, config, online=True, results=None, negative=None, quota=None, cancel=None):
+    """Find the id and the card status of game. Returns whatever the net was accessed, which means that the caller should sleep.
+    Raises Cancelled if cancel is cancelled in the middle."""
+    logging.info("Processing: %s", game.users_name)
+    with TIMEOUTS.game():
+        accessed_net = game.find_id(app_list, config, online, results=results, negative=negative, quota=quota, cancel=cancel)
+        if game.id is None:
+            logging.error("Couldn't find ID for %s", game.users_name)
+            return accessed_net
+
+        searched = accessed_net  # find_id only goes online to search Google
+        accessed_net = game.fetch_card_info(results, negative, app_list, cancel) or accessed_net  # Order is important here. You don't want to short-circuit the fetch.
+        if searched and app_list is not None and (game.card_status_known or str(game.id).isdecimal() and int(game.id) in app_list.id_lookup):
+            app_list.learn(game.simplified_name, game.id)  # Found offline the next time. Only once the id is known to be a real app: aliases never expire
+    if not game.card_status_known:
+        logging.error("Couldn't find cards status for %s", game.users_name)
+    return accessed_net
+
+
+class Scheduler:
+    """Orders the games of a GameBatch by the expected cost of resolving them. Games that need no network come first, so useful output shows up right away.
+    Of the rest, games that only need an appdetails call come before games that also need Google, which has a small daily quota.
+    The quota goes first to the names that have no match in the AppList at all, and only then to names that match several apps, which have the AppList to fall back on."""
+    DONE = 0  # Card status already known
+    OFFLINE = 1  # Everything is in the results database, or the game failed recently and will be skipped
+    DETAILS = 2  # The id is known, or found offline. Needs an appdetails call
+    SEARCH = 3  # Needs Google, then an appdetails call
+    AMBIGUOUS = 4  # Several apps have this name. Needs Google to choose, but can do without it
+
+    def __init__(self, app_list=None, results=None, negative=None, online=True):
+        self.app_list = app_list
+        self.results = results
+        self.negative = negative
+        self.online = online
+
+    def offline_id(self, game, listed=None):
+        """The appid of game, if it can be found without the network the way Game.find_id() would find it. None otherwise.
+        listed is the appid AppList.match() already found for the name, when a whole batch was matched at once. See order()"""
+        app_id = game.id
+        if app_id is None and self.results is not None:
+            app_id = self.results.lookup_id(game.simplified_name)
+        if app_id is None and listed is not None:
+            app_id = listed
+        elif app_id is None and self.app_list is not None and (not self.online or not self.app_list.contains_duplicates(game.simplified_name)):
+            app_id = self.app_list.lookup(game.simplified_name)
+        return app_id
+
+    def classify(self, game, listed=None):
+        if game.card_status_known:
+            return Scheduler.DONE
+
+        app_id = self.offline_id(game, listed)
+        if app_id is None:
+            if not self.online or (self.negative is not None and self.negative.get(NegativeCache.NAME, game.simplified_name) is not None):
+                return Scheduler.OFFLINE
+            if self.app_list is not None and game.simplified_name in self.app_list.name_lookup:
+                return Scheduler.AMBIGUOUS
+            return Scheduler.SEARCH
+
+        if self.results is not None and self.results.lookup_cards(app_id) is not None:
+            return Scheduler.OFFLINE
+        if self.negative is not None and self.negative.get(NegativeCache.APP, app_id) is not None:
+            return Scheduler.OFFLINE
+        return Scheduler.DETAILS
+
+    def order(self, batch):
+        """Indexes of the games in batch, cheapest first. Games of the same cost keep their input order."""
+        buckets = ([], [], [], [], [])
+        unknown = [i for i in range(len(batch)) if batch.status[i] == GameBatch.STATUS_UNKNOWN]
+        listed = [None] * len(unknown)
+        if self.app_list is not None:
+            listed = self.app_list.match([batch.names[i] for i in unknown])  # Every name of the batch in one pass, instead of one lookup per game
+        buckets[Scheduler.DONE].extend(i for i in range(len(batch)) if batch.status[i] != GameBatch.STATUS_UNKNOWN)  # Skip creating a Game object for the common case
+        for i, app_id in zip(unknown, listed):
+            buckets[self.classify(batch.game(i), app_id)].append(i)
+        logging.info("Scheduled %d done, %d offline, %d appdetails only, %d google searches, %d ambiguous names", *map(len, buckets))
+        return [i for bucket in buckets for i in bucket]
+
+
+class Planner(Scheduler):
+    """Dry run. Resolves whatever can be resolved offline and predicts the rest of the run: the calls to every host, the Google quota it takes and how long it will be.
+    The games, with everything found offline filled in, can be written out as a plan. A real run over the plan then starts right where the offline work ended."""
+    REQUEST_TIME = 0.5  # Seconds. Assumed length of a single request, on top of the sleeps of the Delayer
+
+    def __init__(self, app_list=None, results=None, negative=None, quota=None, delayer=None, online=True):
+        super().__init__(app_list, results, negative, online)
+        self.quota = quota
+        self.delayer = delayer
+
+    def plan(self, rows, out=None):
+        """Classify the rows, and write them to the Exporter out with whatever was found offline. Returns the counts of the classes, by Scheduler constant."""
+        counts = [0] * 5
+        for row in rows:
+            game = game_from_row(*row)
+            counts[self.classify(game)] += 1
+            if not game.card_status_known:
+                game.id = self.offline_id(game)
+                has_cards = self.results.lookup_cards(game.id) if self.results is not None and game.id is not None else None
+                if has_cards is not None:
+                    game.card_status_known, game.has_cards = True, has_cards
+            if out is not None:
+                out.write(game)
+        return counts
+
+    def predict(self, counts):
+        """What running the classified games will take. The quota goes to the names missing from the AppList first, like in a scheduled run.
+        Ambiguous names left without a search fall back to the AppList. Missing names left without one are deferred to another day."""
+        remaining = self.quota.remaining() if self.quota is not None and self.online else 0
+        searches = min(counts[Scheduler.SEARCH], remaining)
+        searches += min(counts[Scheduler.AMBIGUOUS], remaining - searches)
+        deferred = counts[Scheduler.SEARCH] - min(counts[Scheduler.SEARCH], remaining)
+        details = counts[Scheduler.DETAILS] + counts[Scheduler.SEARCH] - deferred + counts[Scheduler.AMBIGUOUS]
+        seconds = (searches + details) * Planner.REQUEST_TIME
+        if self.delayer is not None:  # Every game that goes online is followed by a sleep
+            seconds += details * self.delayer.short + details // self.delayer.count * self.delayer.long
+        return {"games": sum(counts), "done": counts[Scheduler.DONE], "offline": counts[Scheduler.OFFLINE], "searches": searches, "quota left": remaining,
+                "deferred": deferred, "details": details, "seconds": seconds}
+
+    @staticmethod
+    def report(prediction):
+        """Lines describing a prediction, for the user."""
+        return ["Games: %d. Already known: %d. Resolved offline or skipped: %d" % (prediction["games"], prediction["done"], prediction["offline"]),
+                "Google searches (%s): %d of the %d left today. Deferred for lack of quota: %d" % (urllib.parse.urlsplit(Game.GOOGLE_API_URL).netloc, prediction["searches"], prediction["quota left"], prediction["deferred"]),
+                "Steam appdetails calls (%s): %d" % (urllib.parse.urlsplit(Game.APP_DETAILS_URL).netloc, prediction["details"]),
+                "Projected time: %s" % format_duration(prediction["seconds"])]
+
+
+def process_rows(rows, export, live, progress, sleep, app_list, config, results=None, negative=None, quota=None, cancel=None, keep_rest=True, online=True):
+    """Resolve the games of rows in order and write them to export as they are found. The games are also written to live, and counted in progress. Google is searched only if online.
+    On Ctrl+C, or when cancel is cancelled, the rest of the rows are written to export as they are, unless keep_rest is False. Then they are left for a later run."""
+    game = None
+    try:
+        for row in rows:
+            progress.log()
+            if row[2]:  # Card status is already known. Nothing to do.
+                export.write_row(*row)
+                live.write_row(*row)
+                progress.record(Progress.CACHED)
+                continue
+
+            game = game_from_row(*row)
+            accessed_net = resolve(game, app_list, config, online, results=results, negative=negative, quota=quota, cancel=cancel)
+            export.write(game)  # Games that failed are written too, so that a later run can retry them. For example, when Google's quota is used up.
+            live.write(game)
+            progress.record_game(game, accessed_net)
+            game = None
+
+            if accessed_net:  # We go to sleep if we gone online. Regardless of "err" and our success with fetching the cards.
+                sleep.tick(cancel)
+    except (KeyboardInterrupt, Cancelled):
+        if not keep_rest:
+            logging.warning("Stopped. The games that were not processed are left for the next update.")
+            if cancel is None:
+                raise
+            cancel.cancel()  # Ctrl+C stops the caller too, like InputWatcher.watch(), not only these rows
+            return
+        logging.warning("Stopped. Writing the games that were not processed as they are, so that a later run can continue from here.")
+        if game is not None:
+            export.write(game)
+        for row in rows:
+            export.write_row(*row)
+
+
+class InputWatcher:
+    """Incremental processing of a list that only grows, like the output of a previous run with new games appended to it.
+    The byte offset up to which path_in was processed is kept in a small state file, with a hash of the content before it. update() then reads only what was appended
+    after the offset and appends the results to path_out, so an update costs as much as the new lines, not the whole list.
+    If the processed part of path_in changed (the hash doesn't match, or the file got shorter) or path_out is missing, the whole list is processed again and path_out is rewritten."""
+    STATE_SUFFIX = ".state"
+    HASH_SPAN = 1 << 16  # Bytes hashed at the start of the file and right before the offset. Enough to notice edits without reading the whole file.
+
+    def __init__(self, path_in, path_out, state_path=None):
+        self.path_in = path_in
+        self.path_out = path_out
+        self.state_path = state_path if state_path is not None else path_out + InputWatcher.STATE_SUFFIX
+        self.offset = 0
+        self.row_end = 0  # The offset after the line of the row being processed
+
+    @staticmethod
+    def __content_hash__(mapped, offset):
+        head = mapped.map[:min(offset, InputWatcher.HASH_SPAN)]
+        tail = mapped.map[max(offset - InputWatcher.HASH_SPAN, 0):offset]
+        return zlib.crc32(tail, zlib.crc32(head))
 
-    init_log(filename="log.txt", console=True, level=logging.DEBUG)
+    def load_offset(self, mapped):
+        """The offset to continue from. 0 if the state is missing or doesn't match the content of path_in."""
+        try:
+            with open(self.state_path, encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return 0
+        offset = state.get("offset", 0)
+        if state.get("input") != os.path.abspath(self.path_in) or not os.path.exists(self.path_out) or offset > mapped.size:
+            return 0
+        if InputWatcher.__content_hash__(mapped, offset) != state.get("hash"):
+            logging.info("%s was changed since the last update. Processing all of it again.", self.path_in)
+            return 0
+        return offset
+
+    def save_offset(self, mapped):
+        with open(self.state_path, "w", encoding="utf-8") as file:
+            json.dump({"input": os.path.abspath(self.path_in), "offset": self.offset, "hash": InputWatcher.__content_hash__(mapped, self.offset)}, file)
+
+    class TrackedExport:
+        """Passes the rows on to an Exporter, and moves the offset of the InputWatcher past the line of every row that was written."""
+
+        def __init__(self, watcher, export):
+            self.watcher = watcher
+            self.export = export
+
+        def add_output(self, output):
+            self.export.add_output(output)
+
+        def write(self, game):
+            self.export.write(game)
+            self.watcher.offset = self.watcher.row_end
+
+        def write_row(self, *row):
+            self.export.write_row(*row)
+            self.watcher.offset = self.watcher.row_end
+
+    def __rows__(self, mapped, start, end):
+        for self.row_end, row in mapped.rows_with_offsets(start, end):
+            yield row
+        self.offset = max(self.offset, end)  # Every line was processed, including the empty ones at the end
+
+    def update(self, process, complete_lines=False):
+        """Process whatever was appended to path_in since the last update. process(rows, export) resolves rows and writes them to export, see process_rows().
+        complete_lines leaves a last line without a line break for the next update, in case it is still being written. Returns the number of new bytes processed."""
+        with closing(MappedInput(self.path_in)) as mapped:
+            start = self.load_offset(mapped)
+            end = mapped.map.rfind(b"\n") + 1 if complete_lines else mapped.size
+            if start >= end and start > 0:
+                return 0
+            logging.info("Processing %s from byte %d to %d", self.path_in, start, end)
+            self.offset = start
+            export = Exporter(Exporter.CSVFile(self.path_out, append=start > 0), buffer_size=100, buffer_time=5)
+            try:
+                with closing(export):
+                    process(self.__rows__(mapped, start, end), InputWatcher.TrackedExport(self, export))
+            finally:
+                self.save_offset(mapped)  # Also when stopped. The rows written so far are in path_out, and must not be written again by the next update
+            return self.offset - start
+
+    def watch(self, process, interval=5, cancel=None):
+        """Update every interval seconds, until cancel is cancelled or Ctrl+C."""
+        cancel = cancel if cancel is not None else Cancellation()
+        try:
+            while not cancel.cancelled:
+                self.update(process, complete_lines=True)
+                cancel.sleep(interval)
+        except (KeyboardInterrupt, Cancelled):
+            pass
+
+
+def run(path_in, path_out, db_path=None, source=None, shard=None, config_path="./config.txt", log_path="log.txt", mapped=False, negative_path=NegativeCache.DEFAULT_PATH, scheduled=False, quota_path=GoogleQuota.DEFAULT_PATH, cancel=None, log_level=logging.DEBUG, log_levels=None, aliases_path=AliasTable.DEFAULT_PATH, deadline=None, output_format="csv"):
+    """Process the list of games in path_in and write the results to path_out, in one of Exporter.FORMATS. If db_path is set the results database there is used as a cache and receives the results.
+    The run stops early on Ctrl+C, or when the optional Cancellation is cancelled. The games that were not processed are then written to path_out as they were.
+    shard is an optional (index, count) pair. Only the games that belong to this shard are processed. See shard_of() and merge_shards()
+    mapped reads path_in through MappedInput. The file is paged in by the OS instead of read through Python's text I/O. Not faster per row than the default reader, see Benchmark.py
+    scheduled processes the games cheapest first (see Scheduler). Results are logged as they are found and path_out is written in input order at the end.
+    log_level and the optional {module: level} log_levels set the verbosity of the log, which is written on a background thread. See init_log()
+    deadline is an optional time limit for the whole run, in seconds. When it passes the run stops as if cancelled, and the games left are written as they are."""
+    init_log(filename=log_path, console=True, level=log_level, queued=True, levels=log_levels)
+    if deadline is not None:
+        cancel = cancel if cancel is not None else Cancellation()
+        cancel.cancel_after(deadline)
     logging.info("Loading configuration file")
-    config = load_config_file("./config.txt")
+    config = load_config_file(config_path)
     logging.info("Loading AppList")
-    app_list = AppList().fetch()
+    app_list = AppList(AliasTable(aliases_path)).fetch()
     logging.info("Creating timer")
-    sleep = Delayer(50, 1.5, 15)
+    sleep = Delayer(*config.get("delay", [50, 1.5, 15]))
+    results = ResultsDB(db_path) if db_path is not None else None
+    negative = NegativeCache(negative_path, config.get("negative_ttl"))
+    quota = GoogleQuota(config["keys"], quota_path, config.get("google_daily_limit", GoogleQuota.DAILY_LIMIT))
+    logging.info("Google searches left today: %d", quota.remaining())
     logging.info("Creating an exporter")
-    with closing(Exporter(Exporter.CSVFile(path_out), Exporter.Log())) as export:
+    # Written to a temporary file that replaces the target at the end, so the target may also be the input file, like the output of a previous run.
+    export = Exporter(getattr(Exporter, Exporter.FORMATS[output_format])(path_out, atomic=True), buffer_size=100, buffer_time=5)
+    if results is not None:
+        export.add_output(Exporter.Database(results, source if source is not None else os.path.basename(path_in)))
+    live = Exporter(Exporter.Log())  # Shows the results as soon as they are found
+    mapped_input = MappedInput(path_in) if mapped else None
+    rows = mapped_input.rows() if mapped else users_row_gen(path_in)
+    if shard is not None:
+        rows = (row for row in rows if shard_of(simplified_name(row[0]), shard[1]) == shard[0])
+        total = sum(1 for row in users_row_gen(path_in) if shard_of(simplified_name(row[0]), shard[1]) == shard[0])
+    else:
+        total = count_lines(path_in)
+    progress = Progress(total, sleep)
+
+    with closing(export), closing(live):
+        if scheduled:
+            quota.reserve = 0  # The scheduler gives the quota to the names missing from the AppList first already
+            batch = GameBatch()
+            for row in rows:
+                batch.append_row(*row)
+
+            try:
+                for i in Scheduler(app_list, results, negative).order(batch):
+                    progress.log()
+                    if batch.status[i] != GameBatch.STATUS_UNKNOWN:
+                        live.write_row(*batch.row(i))
+                        progress.record(Progress.CACHED)
+                        continue
+                    game = batch.game(i)
+                    try:
+                        accessed_net = resolve(game, app_list, config, results=results, negative=negative, quota=quota, cancel=cancel)
+                    finally:
+                        batch.update(i, game)  # Keep whatever was found, even if stopped in the middle
+                    live.write(game)
+                    progress.record_game(game, accessed_net)
+                    if accessed_net:
+                        sleep.tick(cancel)
+            except (KeyboardInterrupt, Cancelled):
+                logging.warning("Stopped. Writing the results found so far.")
+
+            export.write_batch(batch)
+
+        else:
+            process_rows(rows, export, live, progress, sleep, app_list, config, results, negative, quota, cancel)
 
-        for game in users_game_gen(path_in):
-            err = False
-            logging.info("Processing: %s", game.users_name)
-            accessed_net = game.find_id(app_list, config)
-            if game.id is None:
-                logging.error("Couldn't find ID for %s", game.users_name)
-                err = True
+        if mapped_input is not None:
+            mapped_input.close()  # Before the target replaces the input, if they are the same file
+        export.commit()  # The games that were not processed were written too, so the output is complete even if the run was stopped
 
-            if not err:
-                accessed_net = game.fetch_card_info() or accessed_net  # Order is important here. You don't want to short-circuit the fetch.
-                if not game.card_status_known:
-                    logging.error("Couldn't find cards status for %s", game.users_name)
-                    err = True
+    logging.info("Progress: %s", progress.summary())
+    negative.save()
+    app_list.aliases.save()
+    if results is not None:
+        results.close()
+    logging.shutdown()
 
-            if not err:
-                export.write(game)
 
-            if accessed_net:  # We go to sleep if we gone online. Regardless of "err" and our success with fetching the cards.
-                sleep.tick()
+def update(path_in, path_out, db_path=None, source=None, config_path="./config.txt", log_path="log.txt", negative_path=NegativeCache.DEFAULT_PATH, quota_path=GoogleQuota.DEFAULT_PATH, state_path=None, watch=None, cancel=None, log_level=logging.DEBUG, log_levels=None, aliases_path=AliasTable.DEFAULT_PATH, deadline=None, crawl=False):
+    """Like run(), but only the lines appended to path_in since the last update are processed, and their results are appended to path_out. See InputWatcher.
+    watch is an optional interval in seconds. path_in is then checked for new lines again and again, until Ctrl+C or until cancel is cancelled.
+    crawl fills the card index of the results database in the background while watching, see CardCrawler. Crawler and updates share one Delayer, so together they keep its rate limits."""
+    init_log(filename=log_path, console=True, level=log_level, queued=True, levels=log_levels)
+    config = load_config_file(config_path)
+    app_list = AppList(AliasTable(aliases_path)).fetch()
+    sleep = Delayer(*config.get("delay", [50, 1.5, 15]))
+    results = ResultsDB(db_path) if db_path is not None else None
+    negative = NegativeCache(negative_path, config.get("negative_ttl"))
+    quota = GoogleQuota(config["keys"], quota_path, config.get("google_daily_limit", GoogleQuota.DAILY_LIMIT))
+    source = source if source is not None else os.path.basename(path_in)
+    cancel = cancel if cancel is not None else Cancellation()
+    if deadline is not None:
+        cancel.cancel_after(deadline)
+
+    def process(rows, export):
+        if results is not None:
+            export.add_output(Exporter.Database(results, source))
+        progress = Progress(None, sleep)
+        with closing(Exporter(Exporter.Log())) as live:
+            process_rows(rows, export, live, progress, sleep, app_list, config, results, negative, quota, cancel, keep_rest=False)
+        logging.info("Progress: %s", progress.summary())
+        negative.save()
+        app_list.aliases.save()
+        if cancel.cancelled:
+            raise Cancelled()
+
+    watcher = InputWatcher(path_in, path_out, state_path)
+    if watch is None:
+        try:
+            watcher.update(process)
+        except (KeyboardInterrupt, Cancelled):
+            pass
+    else:
+        crawler = CardCrawler(results, app_list, sleep, cancel).start() if crawl and results is not None else None
+        watcher.watch(process, watch, cancel)
+        if crawler is not None:
+            cancel.cancel()
+            crawler.join()
+    if results is not None:
+        results.close()
+    logging.shutdown()
+
 
+def plan(path_in, plan_path=None, db_path=None, config_path="./config.txt", negative_path=NegativeCache.DEFAULT_PATH, quota_path=GoogleQuota.DEFAULT_PATH, aliases_path=AliasTable.DEFAULT_PATH, online=True):
+    """Predict what processing path_in will take, without accessing the net besides loading the AppList. See Planner.
+    If plan_path is set, the list is written there with everything found offline. Run it instead of path_in to skip the offline work."""
+    config = load_config_file(config_path)
+    results = ResultsDB(db_path) if db_path is not None else None
+    planner = Planner(AppList(AliasTable(aliases_path)).fetch(), results, NegativeCache(negative_path, config.get("negative_ttl")),
+                      GoogleQuota(config["keys"], quota_path, config.get("google_daily_limit", GoogleQuota.DAILY_LIMIT)), Delayer(*config.get("delay", [50, 1.5, 15])), online)
+    out = Exporter(Exporter.CSVFile(plan_path), buffer_size=1000) if plan_path is not None else None
+    counts = planner.plan(users_row_gen(path_in), out)
+    if out is not None:
+        out.close()
+    if results is not None:
+        results.close()
+    return planner.predict(counts)
+
+
+def crawl(db_path, limit=None, config_path="./config.txt", log_path="log.txt", log_level=logging.INFO, log_levels=None):
+    """Fill the card index of the results database. See CardCrawler"""
+    init_log(filename=log_path, console=True, level=log_level, queued=True, levels=log_levels)
+    config = load_config_file(config_path)
+    results = ResultsDB(db_path)
+    checked = CardCrawler(results, AppList().fetch(), Delayer(*config.get("delay", [50, 1.5, 15]))).crawl(limit)
+    total, available, with_cards = results.card_index_size()
+    logging.info("Checked %d apps. The card index has %d apps, %d of them available, %d with cards.", checked, total, available, with_cards or 0)
+    results.close()
     logging.shutdown()
 
 
+def aliases(args):
+    """Export the alias table, to share it with another machine, or import one exported there. See AliasTable"""
+    table = AliasTable(args.file)
+    if args.action == "export":
+        table.save(args.path)
+        print("Exported %d aliases to %s" % (len(table.entries), args.path))
+    else:
+        count = table.merge(args.path, args.overwrite)
+        table.save()
+        print("Imported %d aliases from %s" % (count, args.path))
+
+
+def query(args):
+    """Answer questions about previous runs from the results database."""
+    results = ResultsDB(args.db)
+    if args.query == "cards":
+        for source, count in results.sources_with_cards():
+            print("%s: %d games with cards" % (source, count))
+    elif args.query == "find":
+        for source, name, appid, known, has_cards in results.sources_of(args.name):
+            print("%s: %s,%s,%s" % (source, name, appid or "", "" if not known else "TRUE" if has_cards else "FALSE"))
+    elif args.query == "list":
+        for name, appid, known, has_cards in results.games_in(args.name):
+            print("%s,%s,%s" % (name, appid or "", "" if not known else "TRUE" if has_cards else "FALSE"))
+    results.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Find out which games in a list have Steam trading cards.")
+    commands = parser.add_subparsers(dest="command")
+
+    parser_run = commands.add_parser("run", help="Process a list of games (default)")
+    parser_run.add_argument("input", nargs="?", default="Test/big_list.txt")
+    parser_run.add_argument("output", nargs="?", default="Test/big_list_out.csv")
+    parser_run.add_argument("--db", help="Results database used as a cache, which also receives the results")
+    parser_run.add_argument("--source", help="Name of the list in the results database. Defaults to the input file name")
+    parser_run.add_argument("--shard", help="I/N. Process only the I-th of N shards of the input (0 <= I < N). Every shard can run on a different machine. See the merge command")
+    parser_run.add_argument("--config", default="./config.txt")
+    parser_run.add_argument("--log", default="log.txt")
+    parser_run.add_argument("--negative-cache", default=NegativeCache.DEFAULT_PATH, help="File remembering names and appids that failed to resolve on previous runs")
+    parser_run.add_argument("--schedule", action="store_true", help="Process the games that need no network first. The output is still in input order, but written only at the end")
+    parser_run.add_argument("--quota-file", default=GoogleQuota.DEFAULT_PATH, help="File counting today's Google searches of every key")
+    parser_run.add_argument("--format", choices=list(Exporter.FORMATS), default="csv", help="Format of the output. Only csv can be the input of another run, update or merge")
+    parser_run.add_argument("--mmap", action="store_true", help="Read the input through a memory map instead of Python's text I/O. Not faster per row. See Benchmark.py")
+
+    parser_update = commands.add_parser("update", help="Process only the lines appended to the input since the last update, and append their results to the output")
+    parser_update.add_argument("input")
+    parser_update.add_argument("output")
+    parser_update.add_argument("--watch", type=float, metavar="SECONDS", help="Keep checking the input for new lines every SECONDS seconds, until Ctrl+C")
+    parser_update.add_argument("--state", help="File remembering how much of the input was processed. Defaults to the output file name + %s" % InputWatcher.STATE_SUFFIX)
+    parser_update.add_argument("--db", help="Results database used as a cache, which also receives the results")
+    parser_update.add_argument("--crawl", action="store_true", help="With --watch and --db: fill the card index of the database in the background while watching. See the crawl command")
+    parser_update.add_argument("--source", help="Name of the list in the results database. Defaults to the input file name")
+    parser_update.add_argument("--config", default="./config.txt")
+    parser_update.add_argument("--log", default="log.txt")
+    parser_update.add_argument("--negative-cache", default=NegativeCache.DEFAULT_PATH)
+    parser_update.add_argument("--quota-file", default=GoogleQuota.DEFAULT_PATH)
+
+    parser_merge = commands.add_parser("merge", help="Recombine the outputs of sharded runs into one csv file, in the order of the input")
+    parser_merge.add_argument("input", help="The input list all the shards were made from")
+    parser_merge.add_argument("output")
+    parser_merge.add_argument("shards", nargs="+", help="Outputs of the shard runs")
+
+    parser_plan = commands.add_parser("plan", help="Predict the network calls, Google quota and time a run of the list will take, without running it")
+    parser_plan.add_argument("input")
+    parser_plan.add_argument("plan", nargs="?", help="Write the list here, with everything that was found offline. Run it instead of the input")
+    parser_plan.add_argument("--db", help="Results database of previous runs")
+    parser_plan.add_argument("--config", default="./config.txt")
+    parser_plan.add_argument("--negative-cache", default=NegativeCache.DEFAULT_PATH)
+    parser_plan.add_argument("--quota-file", default=GoogleQuota.DEFAULT_PATH)
+    parser_plan.add_argument("--aliases", default=AliasTable.DEFAULT_PATH)
+    parser_plan.add_argument("--offline", action="store_true", help="Plan a run that doesn't use Google")
+
+    parser_crawl = commands.add_parser("crawl", help="Check the card status of every app on Steam, so that later runs can answer offline. Can be stopped and resumed")
+    parser_crawl.add_argument("--db", default=ResultsDB.DEFAULT_PATH)
+    parser_crawl.add_argument("--limit", type=int, help="Check at most this many apps")
+    parser_crawl.add_argument("--config", default="./config.txt")
+    parser_crawl.add_argument("--log", default="log.txt")
+
+    parser_aliases = commands.add_parser("aliases", help="Export the names learned from Google, or import the ones learned on another machine")
+    parser_aliases.add_argument("action", choices=["export", "import"])
+    parser_aliases.add_argument("path")
+    parser_aliases.add_argument("--file", default=AliasTable.DEFAULT_PATH, help="The alias table of this machine")
+    parser_aliases.add_argument("--overwrite", action="store_true", help="On import, replace the appid of names that are already in the table")
+
+    parser_query = commands.add_parser("query", help="Query the results database")
+    parser_query.add_argument("query", choices=["cards", "find", "list"], help="cards: lists containing games with cards. find: lists containing NAME. list: games in the list NAME")
+    parser_query.add_argument("name", nargs="?")
+    parser_query.add_argument("--db", default=ResultsDB.DEFAULT_PATH)
+
+    for command in [parser_run, parser_update]:
+        command.add_argument("--deadline", type=float, metavar="SECONDS", help="Stop after SECONDS seconds and write the results found so far. The rest is left for a later run")
+        command.add_argument("--aliases", default=AliasTable.DEFAULT_PATH, help="File of names learned from Google, and added by hand, that the AppList doesn't know")
+    for command in [parser_run, parser_update, parser_crawl]:
+        command.add_argument("--log-level", action="append", metavar="[MODULE=]LEVEL", help="Verbosity of the log, like INFO or Main=WARNING. Can be given several times, for different modules")
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args = parser.parse_args(["run"])
+    if args.command in ("run", "update", "crawl"):
+        try:
+            log_level, log_levels = parse_log_levels(args.log_level)
+        except ValueError as e:
+            parser.error(str(e))
+        log_options = {"log_levels": log_levels} if log_level is None else {"log_level": log_level, "log_levels": log_levels}
+
+    if args.command == "run":
+        shard = None
+        if args.shard is not None:
+            try:
+                shard = tuple(int(x) for x in args.shard.split("/"))
+            except ValueError:
+                parser.error("--shard must be I/N")
+            if len(shard) != 2 or not 0 <= shard[0] < shard[1]:
+                parser.error("--shard must be I/N with 0 <= I < N")
+            # Shards may run side by side on one machine. Each one keeps its own log and negative cache, unless told otherwise, instead of overwriting the files of the others.
+            # The aliases and the quota count are shared. Their files are locked while they are updated, see file_lock()
+            for option in ["log", "negative_cache"]:
+                if getattr(args, option) == parser_run.get_default(option):
+                    setattr(args, option, shard_path(getattr(args, option), shard[0]))
+        run(args.input, args.output, args.db, args.source, shard, args.config, args.log, args.mmap, args.negative_cache, args.schedule, args.quota_file, aliases_path=args.aliases, deadline=args.deadline, output_format=args.format, **log_options)
+    elif args.command == "update":
+        update(args.input, args.output, args.db, args.source, args.config, args.log, args.negative_cache, args.quota_file, args.state, args.watch, aliases_path=args.aliases, deadline=args.deadline, crawl=args.crawl, **log_options)
+    elif args.command == "plan":
+        prediction = plan(args.input, args.plan, args.db, args.config, args.negative_cache, args.quota_file, args.aliases, not args.offline)
+        print("\n".join(Planner.report(prediction)))
+    elif args.command == "crawl":
+        crawl(args.db, args.limit, args.config, args.log, **log_options)
+    elif args.command == "merge":
+        merge_shards(args.input, args.shards, args.output)
+    elif args.command == "aliases":
+        aliases(args)
+    elif args.command == "query":
+        if args.query != "cards" and args.name is None:
+            parser.error("query %s requires NAME" % args.query)
+        query(args)
+
+
 if __name__ == "__main__":
     main()
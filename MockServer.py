@@ -0,0 +1,72 @@
+"""
+Local stand-in for the Steam and Google web apis. Used to try the tool, for example sharded runs, without network access or rate limits.
+Run: python MockServer.py [port] [number of apps]
+Then point config.txt at it:
+    {"cx": "mock", "key": "mock", "delay": [50, 0, 0],
+     "google_api_url": "http://localhost:8000/customsearch/v1",
+     "app_details_url": "http://localhost:8000/api/appdetails/",
+     "applist_url": "http://localhost:8000/ISteamApps/GetAppList/v0001/"}
+
+App number i is called "Mock Game i". Even appids have cards. Google finds "Mock Game i" for any query ending with i.
+"""
+
+import json
+import sys
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Handler(BaseHTTPRequestHandler):
+    app_count = 1000
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+
+        if url.path.startswith("/ISteamApps/GetAppList"):
+            apps = [{"appid": i, "name": "Mock Game %d" % i} for i in range(1, Handler.app_count + 1)]
+            self.send_json({"applist": {"apps": {"app": apps}}})
+
+        elif url.path.startswith("/api/appdetails"):
+            app_id = query.get("appids", [""])[0]
+            if not app_id.isdecimal() or not 0 < int(app_id) <= Handler.app_count:
+                self.send_json({app_id: {"success": False}})
+                return
+            categories = [{"id": 2, "description": "Single-player"}]
+            if int(app_id) % 2 == 0:
+                categories.append({"id": 29, "description": "Steam Trading Cards"})
+            self.send_json({app_id: {"success": True, "data": {"type": "game", "name": "Mock Game " + app_id, "categories": categories}}})
+
+        elif url.path.startswith("/customsearch/v1"):
+            words = query.get("q", [""])[0].split()
+            if not words or not words[-1].isdecimal():
+                self.send_json({"searchInformation": {"totalResults": "0"}})
+                return
+            link = "https://store.steampowered.com/app/%s/Mock_Game/" % words[-1]
+            self.send_json({"searchInformation": {"totalResults": "1"}, "items": [{"title": "Mock Game " + words[-1], "link": link}]})
+
+        else:
+            self.send_error(404)
+
+    def send_json(self, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    Handler.app_count = int(sys.argv[2]) if len(sys.argv) > 2 else Handler.app_count
+    server = ThreadingHTTPServer(("localhost", port), Handler)
+    print("Mock server listening on http://localhost:%d/" % port)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
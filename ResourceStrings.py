@@ -14,6 +14,7 @@ instruction = \
 button_open = "Open list"
 button_save = "Save target"
 button_start = "Start"
+button_stop = "Stop"
 checkbox_online = "Use Google?"
 
 title_open = "Open"
@@ -32,6 +33,15 @@ loading_delay = "Creating delay timer...\n"
 loading_exporter = "Creating exporter...\n"
 google_not_found = "\tGoogle search key is not found.\n\tGoogle use is disabled.\n\t(See readme file for details)\n"
 loading_applist = "Loading AppList...\n\n"
+applist_net = "Downloading AppList from Steam...\n"
+applist_disk = "Reading AppList from disk...\n"
+applist_parse = "Parsing AppList...\n"
+applist_index = "Indexing AppList...\n"
+applist_done = "AppList is ready.\n\n"
+waiting_applist = "Waiting for the AppList to finish loading...\n"
+applist_failed = "Failed to load the AppList. See log_engine.txt. Press Start to try again.\n"
 done = "       Finished.\n"
+progress = "Games: %d%s\n%.1f games/min\nTime left: %s\n\nFrom the list: %d\nOffline: %d\nOnline: %d\nFailed: %d"
+stopped = "       Stopped. The games that were not processed were written as they were.\n"
 
 
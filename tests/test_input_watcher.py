@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+import Main as bk
+
+
+class InputWatcherTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path_in = os.path.join(directory.name, "list.txt")
+        self.path_out = os.path.join(directory.name, "out.csv")
+        self.seen = []
+
+    def append(self, text):
+        with open(self.path_in, "a", encoding="utf-8", newline="") as file:
+            file.write(text)
+
+    def process(self, rows, export, stop_after=None):
+        for row in rows:
+            if stop_after is not None and len(self.seen) == stop_after:
+                raise bk.Cancelled()
+            self.seen.append(row[0])
+            export.write_row(*row)
+
+    def output_names(self):
+        return [row[0] for row in bk.users_row_gen(self.path_out)]
+
+    def test_update_reads_only_appended_lines(self):
+        self.append("A,1,TRUE\nB,2,FALSE\n")
+        watcher = bk.InputWatcher(self.path_in, self.path_out)
+        watcher.update(self.process)
+        self.append("C,3,\nD\n")
+        bk.InputWatcher(self.path_in, self.path_out).update(self.process)
+        self.assertEqual(self.seen, ["A", "B", "C", "D"])
+        self.assertEqual(self.output_names(), ["A", "B", "C", "D"])
+        self.assertEqual(bk.InputWatcher(self.path_in, self.path_out).update(self.process), 0)
+        self.assertEqual(self.seen, ["A", "B", "C", "D"])
+
+    def test_resume_after_stop(self):
+        self.append("A,1,TRUE\nB,2,FALSE\nC,3,\nD\n")
+        watcher = bk.InputWatcher(self.path_in, self.path_out)
+        with self.assertRaises(bk.Cancelled):
+            watcher.update(lambda rows, export: self.process(rows, export, stop_after=2))
+        self.assertEqual(self.output_names(), ["A", "B"])
+        self.seen = []
+        bk.InputWatcher(self.path_in, self.path_out).update(self.process)
+        self.assertEqual(self.seen, ["C", "D"])
+        self.assertEqual(self.output_names(), ["A", "B", "C", "D"])
+
+    def test_incomplete_last_line_waits(self):
+        self.append("A,1,TRUE\nB,2")
+        bk.InputWatcher(self.path_in, self.path_out).update(self.process, complete_lines=True)
+        self.assertEqual(self.seen, ["A"])
+        self.append(",FALSE\n")
+        bk.InputWatcher(self.path_in, self.path_out).update(self.process, complete_lines=True)
+        self.assertEqual(self.output_names(), ["A", "B"])
+
+    def test_changed_input_is_processed_again(self):
+        self.append("A,1,TRUE\nB,2,FALSE\n")
+        bk.InputWatcher(self.path_in, self.path_out).update(self.process)
+        with open(self.path_in, "w", encoding="utf-8", newline="") as file:
+            file.write("X,1,TRUE\nB,2,FALSE\nC,3,\n")
+        self.seen = []
+        bk.InputWatcher(self.path_in, self.path_out).update(self.process)
+        self.assertEqual(self.seen, ["X", "B", "C"])
+        self.assertEqual(self.output_names(), ["X", "B", "C"])
+
+
+if __name__ == "__main__":
+    unittest.main()
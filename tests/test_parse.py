@@ -0,0 +1,96 @@
+import csv
+import io
+import os
+import tempfile
+import unittest
+from contextlib import closing
+
+import Main as bk
+
+
+def old_rows(path):
+    """The rows the csv.reader based users_game_gen read before parse_line() and MappedInput, kept as the reference."""
+    rows = []
+    with open(path, encoding='UTF-8', newline="") as file:
+        for row in csv.reader(file):
+            if len(row) == 0:
+                continue
+            if len(row) >= 3 and bk.string_represent_int(row[-2]) and row[-1].upper() in ["TRUE", "FALSE", ""]:
+                known = row[-1] != ""
+                rows.append(("".join(row[:-2]), row[-2], known, known and row[-1].upper() == "TRUE"))
+            else:
+                rows.append(("".join(row), None, False, False))
+    return rows
+
+
+LINES = [
+    "Portal 2,620,TRUE",
+    "Half-Life,70,FALSE",
+    "Braid,26800,",
+    "just a name",
+    "Name, with, commas",
+    "Commas, in the name,400,true",
+    '"Quoted, name",10,TRUE',
+    '"Quoted ""inner"" name",20,FALSE',
+    'Unquoted "inner" quotes,30,TRUE',
+    '"Only quoted"',
+    "Space in the appid, 7,TRUE",
+    "Space after the appid,7 ,FALSE",
+    "Negative appid,-5,TRUE",
+    "Arabic-Indic digits,١٢,TRUE",
+    "Fullwidth digits,１２,FALSE",
+    "Superscript,²,TRUE",
+    "Not a status,12,maybe",
+    "Not an appid,abc,TRUE",
+    "Ünïcödé ñame,1234,TRUE",
+    "",
+    "Windows line end,55,TRUE\r",
+]
+
+
+class ParseLineTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, text):
+        path = os.path.join(self.directory, "list.txt")
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            file.write(text)
+        return path
+
+    def assert_same_rows(self, text):
+        path = self.write(text)
+        expected = old_rows(path)
+        self.assertEqual(list(bk.users_row_gen(path)), expected)
+        with closing(bk.MappedInput(path)) as mapped:
+            self.assertEqual(list(mapped.rows()), expected)
+            self.assertEqual([row for _, row in mapped.rows_with_offsets()], expected)
+
+    def test_same_rows_as_csv_reader(self):
+        self.assert_same_rows("\n".join(LINES) + "\n")
+
+    def test_last_line_without_newline(self):
+        self.assert_same_rows("\n".join(LINES))
+        self.assert_same_rows("Portal 2,620,TRUE\n\"Quoted, name\",10,TRUE")
+        self.assert_same_rows("Portal 2,620,TRUE\nSpace in the appid, 7,")
+
+    def test_each_line(self):
+        for line in LINES:
+            with self.subTest(line=line):
+                self.assert_same_rows(line + "\n")
+
+    def test_parse_line_of_bytes(self):
+        for line in LINES:
+            with self.subTest(line=line):
+                self.assertEqual(bk.MappedInput.parse_line(line.encode("utf-8")), bk.parse_line(line))
+
+    def test_appid_is_kept_as_written(self):
+        self.assertEqual(bk.parse_line("Game, 7,TRUE\n"), ("Game", " 7", True, True))
+        self.assertEqual(bk.parse_line("Game,١٢,\n"), ("Game", "١٢", False, False))
+        self.assertEqual(bk.parse_line("Game,²,TRUE\n"), ("Game²TRUE", None, False, False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+import Main as bk
+
+
+class VariantKeyTest(unittest.TestCase):
+    def key(self, name):
+        return bk.variant_key(bk.Game(name).simplified_name)
+
+    def test_editions_and_numbers_share_a_key(self):
+        self.assertEqual(self.key("The Witcher III GOTY Edition"), self.key("witcher 3"))
+        self.assertEqual(self.key("assassins creed 1"), self.key("Assassin's Creed"))
+        self.assertEqual(self.key("Grand Theft Auto V"), self.key("Grand Theft Auto 5"))
+
+    def test_words_that_look_like_numerals(self):
+        self.assertEqual(self.key("Who Am I"), bk.Game("Who Am I").simplified_name)
+        self.assertEqual(self.key("Mega Man X"), bk.Game("Mega Man X").simplified_name)
+        self.assertEqual(self.key("V"), bk.Game("V").simplified_name)
+
+    def test_only_the_last_word_is_converted(self):
+        self.assertEqual(self.key("Final Fantasy VII"), self.key("final fantasy 7"))
+        self.assertNotEqual(self.key("Star Wars Episode IV A New Hope"), self.key("Star Wars Episode 4 A New Hope"))
+
+    def test_plain_names_are_unchanged(self):
+        for name in ["portal", "half life", "the", "1"]:
+            with self.subTest(name=name):
+                self.assertEqual(bk.variant_key(name), name)
+
+
+if __name__ == "__main__":
+    unittest.main()